@@ -0,0 +1,325 @@
+"""
+Join -> detection benchmark
+
+Replays synthetic join streams through on_member_join (and so
+AltDetector.detect_alt or the raid batch path) against fake guilds and
+members, with an in-memory stand-in behind the real Database class - or a
+real Postgres with --database-url. Prints one JSON document with per-join
+latency, throughput, database round trips and event loop lag per scenario.
+
+Usage:
+    python bench_joins.py [--scenario NAME ...] [--db-latency MS] [--database-url URL]
+    python bench_joins.py > bench_output.txt
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import string
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import discord
+
+import bot as security_bot
+from bot import Config
+
+# Each scenario: joins, guilds they spread over, joins/sec per guild, name style,
+# and whether raid mode may kick in
+SCENARIOS = {
+    'trickle': dict(joins=300, guilds=20, rate=0.8, names='random', raid=True),
+    'raid': dict(joins=500, guilds=1, rate=250, names='random', raid=True),
+    'similar_wave': dict(joins=1000, guilds=1, rate=100, names='similar', raid=False),
+}
+
+# ============================================
+# IN-MEMORY DATABASE STAND-IN
+# ============================================
+
+class MemoryCursor:
+    """Accepts any statement, returns no rows, counts what it was asked to do"""
+
+    def __init__(self, pool: 'MemoryPool'):
+        self.pool = pool
+        self.connection = pool  # execute_values reads cursor.connection.encoding
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        with self.pool.lock:
+            self.pool.statements += 1
+        self.rowcount = 1  # as if every statement touched a row
+        if self.pool.latency:
+            time.sleep(self.pool.latency)
+
+    def mogrify(self, template, args=None) -> bytes:
+        return b'()'
+
+    def fetchall(self) -> list:
+        return []
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
+
+class MemoryConnection:
+    closed = 0
+
+    def __init__(self, pool: 'MemoryPool'):
+        self.pool = pool
+
+    def cursor(self, cursor_factory=None) -> MemoryCursor:
+        return MemoryCursor(self.pool)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class MemoryPool:
+    """Stands in for ThreadedConnectionPool"""
+
+    encoding = 'UTF8'
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.statements = 0
+        self.lock = threading.Lock()
+
+    def getconn(self) -> MemoryConnection:
+        return MemoryConnection(self)
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+# ============================================
+# FAKE DISCORD OBJECTS
+# ============================================
+
+class FakeChannel(discord.TextChannel):
+    """A security log channel that only counts what it is sent"""
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.messages = 0
+
+    async def send(self, *args, **kwargs):
+        self.messages += 1
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f'Guild {guild_id}'
+        self.member_count = 0
+        self.log_channel = FakeChannel(guild_id * 10)
+
+    def get_channel(self, channel_id: int):
+        return self.log_channel if channel_id == self.log_channel.id else None
+
+class FakeAvatar:
+    url = 'https://cdn.discordapp.com/embed/avatars/0.png'
+
+class FakeMember:
+    def __init__(self, user_id: int, name: str, guild: FakeGuild, age_days: float, has_avatar: bool):
+        self.id = user_id
+        self.name = name
+        self.discriminator = '0'
+        self.bot = False
+        self.guild = guild
+        self.created_at = datetime.now(timezone.utc) - timedelta(days=age_days)
+        self.avatar = FakeAvatar() if has_avatar else None
+        self.display_avatar = FakeAvatar()
+        self.mention = f'<@{user_id}>'
+        self.timeouts = 0
+
+    async def timeout(self, duration, reason=None):
+        self.timeouts += 1
+
+def make_name(style: str, rng: random.Random) -> str:
+    if style == 'similar':
+        # Small edits of a few base names, like a wave of alts
+        base = rng.choice(['shadowhunter', 'nightwolf', 'darkangel'])
+        return base + ''.join(rng.choices(string.digits, k=rng.randint(1, 3)))
+    return ''.join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(5, 14)))
+
+def make_stream(scenario: dict, seed: int) -> tuple:
+    """([(offset seconds, member)] sorted by offset, guilds)"""
+    rng = random.Random(seed)
+    guilds = [FakeGuild(1000 + i) for i in range(scenario['guilds'])]
+    stream = []
+    for i in range(scenario['joins']):
+        guild = guilds[i % len(guilds)]
+        offset = (i // len(guilds)) / scenario['rate']
+        member = FakeMember(
+            10**17 + seed * 10**6 + i,
+            make_name(scenario['names'], rng),
+            guild,
+            rng.uniform(0, 60),
+            rng.random() < 0.6
+        )
+        stream.append((offset, member))
+    stream.sort(key=lambda item: item[0])
+    return stream, guilds
+
+# ============================================
+# REPLAY
+# ============================================
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run_scenario(name: str, scenario: dict, pool: MemoryPool, seed: int) -> dict:
+    stream, guilds = make_stream(scenario, seed)
+    data_manager = security_bot.data_manager
+
+    # Fresh detectors per scenario (on_member_join reads the module globals)
+    detector = security_bot.AltDetector()
+    raid = security_bot.RaidDetector(
+        Config.RAID_JOIN_THRESHOLD if scenario['raid'] else 10**9, Config.RAID_JOIN_WINDOW
+    )
+    security_bot.alt_detector = detector
+    security_bot.raid_detector = raid
+    for guild in guilds:
+        data_manager.log_channels[guild.id] = guild.log_channel.id
+
+    dispatched = {}
+    latencies = []
+    done = asyncio.Event()
+
+    # Raid joiners finish when their batch does, not when on_member_join returns
+    process_batch = detector.process_raid_batch
+
+    async def timed_batch(guild, members):
+        await process_batch(guild, members)
+        finished = time.perf_counter()
+        latencies.extend(finished - dispatched[member.id] for member in members)
+        if len(latencies) >= len(stream):
+            done.set()
+
+    detector.process_raid_batch = timed_batch
+
+    async def join(member):
+        dispatched[member.id] = time.perf_counter()
+        member.guild.member_count += 1
+        await security_bot.on_member_join(member)
+        if member not in raid.queues.get(member.guild.id, ()):
+            latencies.append(time.perf_counter() - dispatched[member.id])
+            if len(latencies) >= len(stream):
+                done.set()
+
+    monitor = security_bot.LoopMonitor(0.05, Config.LOOP_STALL_THRESHOLD)
+    monitor.start()
+    db_stats = data_manager.db.stats
+    queries_before = db_stats['queries']
+    statements_before = pool.statements if pool else 0
+    lag_samples = []
+
+    async def sample_lag():
+        while True:
+            await asyncio.sleep(0.05)
+            lag_samples.append(monitor.last_lag)
+
+    sampler = asyncio.create_task(sample_lag())
+
+    # Replay on the stream's own clock, one task per join like the gateway
+    started = time.perf_counter()
+    tasks = []
+    for offset, member in stream:
+        delay = started + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(join(member)))
+
+    await asyncio.wait_for(done.wait(), timeout=120)
+    elapsed = time.perf_counter() - started
+    await data_manager.flush()
+    await asyncio.gather(*tasks)
+
+    sampler.cancel()
+    monitor._task.cancel()
+
+    # Raid timeouts go through the rate-limited ActionWorker; count what is still queued
+    worker = security_bot.action_worker
+    timeouts_queued = 0
+    while worker.queue and not worker.queue.empty():
+        worker.queue.get_nowait()
+        timeouts_queued += 1
+
+    queries = db_stats['queries'] - queries_before
+    joins = len(stream)
+    result = {
+        'joins': joins,
+        'guilds': scenario['guilds'],
+        'offered_rate': scenario['rate'] * scenario['guilds'],
+        'raid_mode': scenario['raid'],
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2),
+        },
+        'joins_per_sec': round(joins / elapsed, 1),
+        'db_round_trips_per_join': round(queries / joins, 3),
+        'loop_lag_ms': {
+            'p50': round(percentile(lag_samples, 50) * 1000, 2),
+            'p99': round(percentile(lag_samples, 99) * 1000, 2),
+            'max': round(monitor.max_lag * 1000, 2),
+        },
+        'log_messages': sum(guild.log_channel.messages for guild in guilds),
+        'timeouts_applied': sum(member.timeouts for _, member in stream),
+        'timeouts_queued': timeouts_queued,
+    }
+    if pool:
+        result['db_statements_per_join'] = round((pool.statements - statements_before) / joins, 3)
+    return result
+
+async def main(args) -> dict:
+    data_manager = security_bot.data_manager
+    pool = None
+    if args.database_url:
+        Config.DATABASE_URL = args.database_url
+        await data_manager.setup()
+    else:
+        pool = MemoryPool(args.db_latency / 1000)
+        data_manager.db.pool = pool
+        data_manager._flush_task = asyncio.create_task(data_manager._flush_loop())
+
+    results = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'database': 'postgres' if args.database_url else f'memory ({args.db_latency}ms/statement)',
+        'scoring_executor': Config.SCORING_EXECUTOR,
+        'numpy': security_bot.np is not None,
+        'scenarios': {},
+    }
+    try:
+        for seed, name in enumerate(args.scenario or SCENARIOS):
+            logging.getLogger('SecurityBot').info(f'Running {name}...')
+            results['scenarios'][name] = await run_scenario(name, SCENARIOS[name], pool, seed + 1)
+    finally:
+        security_bot.scoring_pool.close()
+        if args.database_url:
+            await data_manager.close()
+        elif data_manager._flush_task:
+            data_manager._flush_task.cancel()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS))
+    parser.add_argument('--db-latency', type=float, default=1.0, help='simulated ms per statement (in-memory mode)')
+    parser.add_argument('--database-url', help='benchmark against this Postgres instead')
+    args = parser.parse_args()
+
+    # Keep stdout clean for the JSON
+    logging.getLogger('SecurityBot').setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(main(args)), indent=2))
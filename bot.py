@@ -9,10 +9,19 @@ Copy this entire thing first!
 import os
 import re
 import asyncio
+import hashlib
+import json
 import logging
+import math
+import multiprocessing
+import queue
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Tuple, Set
-from collections import defaultdict
+from bisect import bisect_left
+from collections import defaultdict, deque, OrderedDict
 from difflib import SequenceMatcher
 from urllib.parse import urlparse
 
@@ -22,11 +31,18 @@ from discord import app_commands
 from discord.ui import Button, View, Modal, TextInput, Select
 
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 from aiohttp import web
 from dotenv import load_dotenv
 
+try:
+    import numpy as np
+except ImportError:  # optional: batch scoring falls back to pure Python
+    np = None
+
 load_dotenv()
 
 logging.basicConfig(
@@ -54,6 +70,18 @@ class Config:
     USERNAME_SIMILARITY = 0.75  # 75% similar = suspicious
     NO_AVATAR_SUSPICIOUS = True
     
+    # Alt scoring rules: points per rule and the minimum score for each level.
+    # Per guild: !altconfig <rule|level> <value> (stored in guild_settings.rule_overrides)
+    RULE_WEIGHTS = {
+        'very_new_account': 3,  # younger than VERY_NEW_ACCOUNT (or minage, if lower)
+        'new_account': 1,  # younger than minage
+        'no_avatar': 1,
+        'similar_username': 2,  # similar to someone in the recent join window
+        'pattern_username': 1,  # matches PATTERN_USERNAMES
+    }
+    LEVEL_THRESHOLDS = {'critical': 6, 'high': 4, 'medium': 2}  # medium+ alerts, critical gets timed out
+    PATTERN_USERNAMES = [r'^([a-zA-Z]+)(\d+)$']  # word + number, like User1
+    
     # Auto actions
     AUTO_KICK_ALTS = False
     AUTO_TIMEOUT_ALTS = True
@@ -62,6 +90,88 @@ class Config:
     # Raid protection
     RAID_JOIN_THRESHOLD = 10
     RAID_JOIN_WINDOW = 10  # seconds
+    RAID_BATCH_INTERVAL = 3  # seconds between raid batches
+    RAID_ACTION_RATE = 2  # timeouts per second during a raid
+    
+    # Recent join window (used for username similarity)
+    RECENT_JOIN_WINDOW = 10  # minutes
+    RECENT_JOIN_MAX = 5000  # per guild
+    
+    # Member scans (!scanserver)
+    SCAN_CHUNK_SIZE = 1000  # members fetched and checkpointed together
+    SCAN_SCORE_BATCH = 250  # members per scoring pool job, so live joins can interleave
+    SCAN_PROGRESS_INTERVAL = 5  # seconds between progress message edits
+    
+    # Gateway intents (lean = no presences, no member cache, no chunking; opt in)
+    LEAN_INTENTS = os.getenv('LEAN_INTENTS', 'false').lower() == 'true'
+    
+    # Scoring pool (alt checks run off the event loop)
+    # 'thread' keeps the loop free to switch tasks, but scoring is pure Python and holds
+    # the GIL, so a big raid batch still slows the loop. 'process' scores in parallel,
+    # at the cost of pickling every batch and each spawned worker re-importing bot.py
+    # (~0.5s and ~60 MB RSS apiece). Use 'process' on multi-core hosts that see raids.
+    SCORING_EXECUTOR = os.getenv('SCORING_EXECUTOR', 'thread')  # 'thread' or 'process'
+    SCORING_WORKERS = int(os.getenv('SCORING_WORKERS', 2))
+    SCORING_MAX_INFLIGHT = 4  # batches scored at once; later joins wait their turn
+    
+    # Database pool
+    DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 5))
+    DB_QUERY_TIMEOUT = float(os.getenv('DB_QUERY_TIMEOUT', 5))  # seconds
+    # Prepare named queries once per connection (turn off behind a transaction-mode PgBouncer)
+    DB_PREPARE_STATEMENTS = os.getenv('DB_PREPARE_STATEMENTS', 'true').lower() == 'true'
+    DB_RECONNECT_MIN = float(os.getenv('DB_RECONNECT_MIN', 1))  # seconds before the first reconnect attempt, doubled after each failure...
+    DB_RECONNECT_MAX = float(os.getenv('DB_RECONNECT_MAX', 60))  # ...up to this
+    
+    # Writes made while the database is down go to this file and are replayed in order
+    # (each cluster process gets its own: db_journal.jsonl -> db_journal-<CLUSTER_ID>.jsonl)
+    DB_JOURNAL_PATH = os.getenv('DB_JOURNAL_PATH', 'db_journal.jsonl')
+    DB_JOURNAL_MAX_BYTES = int(os.getenv('DB_JOURNAL_MAX_BYTES', 256 * 2**20))
+    APPLIED_WRITES_RETENTION_DAYS = 7  # how long applied write ids are kept to skip duplicate replays
+    
+    # Write-behind queue for joins and detections
+    WRITE_BATCH_SIZE = 500  # flush early once this many rows are queued
+    WRITE_FLUSH_INTERVAL = 1.0  # seconds
+    WRITE_QUEUE_MAX = 50000  # detections kept while the database is failing
+    
+    # Security log dispatcher
+    LOG_QUEUE_MAX = 500  # embeds queued per guild before the oldest is dropped
+    LOG_RATE_LIMIT = 5  # messages per channel...
+    LOG_RATE_PERIOD = 5  # ...per this many seconds
+    
+    # History retention (applied by cleanup_task)
+    DETECTION_RETENTION_DAYS = int(os.getenv('DETECTION_RETENTION_DAYS', 365))  # per-guild override: guild_settings.retention_days
+    TRACKING_RETENTION_DAYS = int(os.getenv('TRACKING_RETENTION_DAYS', 180))
+    ARCHIVE_DETECTIONS = os.getenv('ARCHIVE_DETECTIONS', 'false').lower() == 'true'  # move instead of delete
+    PARTITION_DETECTIONS = os.getenv('PARTITION_DETECTIONS', 'false').lower() == 'true'  # new databases only
+    PRUNE_BATCH_SIZE = 1000
+    PRUNE_BATCH_PAUSE = 0.2  # seconds between batches
+    
+    # Guild settings cache
+    SETTINGS_TTL = 600  # seconds before a guild's settings are reloaded
+    LISTEN_RETRY_DELAY = 5  # seconds between LISTEN reconnect attempts
+    WHITELIST_CHECK_INTERVAL = 300  # seconds between whitelist version checks
+    WHITELIST_FULL_CHECK_EVERY = 6  # every Nth check runs the checksum even if the version matches
+    
+    # Event loop monitoring
+    LOOP_MONITOR_INTERVAL = 0.5  # seconds
+    LOOP_STALL_THRESHOLD = 0.1  # seconds
+    
+    # Status page and /stats snapshot
+    STATUS_REFRESH_INTERVAL = 15  # seconds
+    
+    # Readiness (/ready): fails on a dead database, gateway or stalled loop
+    READY_CHECK_TTL = 5  # seconds a readiness result is reused for
+    READY_DB_TIMEOUT = 2  # seconds
+    READY_MAX_LATENCY = float(os.getenv('READY_MAX_LATENCY', 10))  # heartbeat seconds
+    READY_MAX_LOOP_LAG = float(os.getenv('READY_MAX_LOOP_LAG', 1))  # seconds
+    
+    # Sharding (PROCESS_COUNT > 1 runs the launcher, one shard process per core)
+    SHARD_COUNT = int(os.getenv('SHARD_COUNT', 0))  # 0 = unsharded
+    SHARD_IDS = {int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i.strip()}  # empty = all
+    PROCESS_COUNT = int(os.getenv('PROCESS_COUNT', 1))
+    CLUSTER_ID = int(os.getenv('CLUSTER_ID', 0))  # set by the launcher for each process
+    CLUSTER_STATS_INTERVAL = 5  # seconds between shard process stats reports
     
     # Colors
     SUCCESS = 0x57F287
@@ -74,59 +184,413 @@ class Config:
 # Paste this right after Section 1
 # ============================================
 
+background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def owns_guild(guild_id: int) -> bool:
+    """Whether this process's shards handle the guild (always true unsharded)"""
+    if not Config.SHARD_COUNT or not Config.SHARD_IDS:
+        return True
+    return (guild_id >> 22) % Config.SHARD_COUNT in Config.SHARD_IDS
+
+def is_primary_process() -> bool:
+    """The one process (shard 0's) that runs table-wide maintenance"""
+    return not Config.SHARD_COUNT or not Config.SHARD_IDS or 0 in Config.SHARD_IDS
+
+# Default latency buckets (seconds) for histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    """Bucketed observations, optionally split by one label"""
+    
+    def __init__(self, name: str, help_text: str, label: str = None, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}  # label value: [per-bucket counts..., +Inf count, sum]
+    
+    def observe(self, value: float, label_value: str = None):
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_value, series in sorted(self.series.items(), key=lambda s: str(s[0])):
+            label = f'{self.label}="{label_value}",' if self.label else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label}le="{bound}"}} {cumulative}')
+            label = f'{{{label[:-1]}}}' if label else ''
+            lines.append(f'{self.name}_sum{label} {series[-1]}')
+            lines.append(f'{self.name}_count{label} {cumulative}')
+        return lines
+
+class Counter:
+    """Monotonic count, optionally split by one label"""
+    
+    def __init__(self, name: str, help_text: str, label: str = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.values = defaultdict(int)  # label value: count
+    
+    def inc(self, label_value: str = None, amount: int = 1):
+        self.values[label_value] += amount
+    
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_value, value in sorted(self.values.items(), key=lambda v: str(v[0])):
+            label = f'{{{self.label}="{label_value}"}}' if self.label else ''
+            lines.append(f'{self.name}{label} {value}')
+        return lines
+
+class Gauge:
+    """A value read only when scraped"""
+    
+    def __init__(self, name: str, help_text: str, read):
+        self.name = name
+        self.help = help_text
+        self.read = read
+    
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.read()}']
+
+class Metrics:
+    """
+    In-process metrics in the Prometheus text format (served at /metrics).
+    
+    Recording is a dict lookup and an add on the event loop thread; all the
+    formatting happens at scrape time, so unscraped metrics cost next to nothing.
+    """
+    
+    def __init__(self):
+        self.all = []
+        self.detect_alt = self._add(Histogram(
+            'securitybot_detect_alt_seconds', 'Time to handle one join in detect_alt'))
+        self.checks = self._add(Histogram(
+            'securitybot_check_seconds', 'Time spent in each alt check per scoring call', 'check'))
+        self.scoring = self._add(Histogram(
+            'securitybot_scoring_seconds', 'Scoring pool round trip, queueing included'))
+        self.db_queries = self._add(Histogram(
+            'securitybot_db_query_seconds', 'Database round trips by query', 'query'))
+        self.discord_requests = self._add(Histogram(
+            'securitybot_discord_request_seconds', 'Discord API calls by operation', 'operation'))
+        self.detections = self._add(Counter(
+            'securitybot_detections_total', 'Alt detections by suspicion level', 'level'))
+        self.exceptions = self._add(Counter(
+            'securitybot_exceptions_total', 'Exceptions caught and handled, by where', 'where'))
+    
+    def _add(self, metric):
+        self.all.append(metric)
+        return metric
+    
+    def gauge(self, name: str, help_text: str, read):
+        """Register a value computed at scrape time"""
+        self._add(Gauge(name, help_text, read))
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self.all:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning(f'Failed to render metric {metric.name}: {e}')
+                self.exceptions.inc('metrics_render')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# Tags this process's own NOTIFY messages so it can skip them
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+ALT_DETECTION_COLUMNS = """
+    guild_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    username TEXT,
+    suspicion_score INTEGER,
+    suspicion_level TEXT,
+    reasons TEXT[],
+    similar_to_user_id BIGINT,
+    similar_to_username TEXT,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    action_taken TEXT,
+    kicked BOOLEAN DEFAULT FALSE,
+    timed_out BOOLEAN DEFAULT FALSE
+"""
+
+class NamedQuery:
+    """A fixed statement with typed parameters, prepared once per connection and run by name"""
+    
+    __slots__ = ('name', 'types', 'sql', 'prepare', 'execute')
+    
+    def __init__(self, name: str, types: Tuple[str, ...], sql: str):
+        self.name = name
+        self.types = types
+        self.sql = sql
+        
+        numbers = iter(range(1, len(types) + 1))
+        body = re.sub('%s', lambda _: f'${next(numbers)}', sql)
+        self.prepare = f'PREPARE {name} ({", ".join(types)}) AS {body}' if types else f'PREPARE {name} AS {body}'
+        self.execute = f'EXECUTE {name} ({", ".join(["%s"] * len(types))})' if types else f'EXECUTE {name}'
+
+def named_queries(*queries: NamedQuery) -> Dict[str, NamedQuery]:
+    return {query.name: query for query in queries}
+
+# The fixed hot-path queries. Bulk join/detection writes stay on execute_values
+# (their VALUES list changes size per batch), and one-off startup loads gain
+# nothing from preparing.
+NAMED_QUERIES = named_queries(
+    NamedQuery('get_recent_joins', ('bigint', 'interval'), """
+        SELECT * FROM user_tracking
+        WHERE guild_id = %s
+        AND last_joined_at >= CURRENT_TIMESTAMP - %s
+        ORDER BY last_joined_at DESC
+    """),
+    NamedQuery('get_all_recent_joins', ('interval',), """
+        SELECT user_id, guild_id, username,
+               avatar_url IS NOT NULL AS has_avatar,
+               EXTRACT(EPOCH FROM account_created_at) AS created_at,
+               EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - last_joined_at) AS age_seconds
+        FROM user_tracking
+        WHERE last_joined_at >= CURRENT_TIMESTAMP - %s
+        ORDER BY last_joined_at ASC
+    """),
+    NamedQuery('whitelist_add', ('bigint', 'bigint', 'bigint', 'text'), """
+        INSERT INTO whitelist (guild_id, user_id, added_by, reason)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT DO NOTHING
+    """),
+    NamedQuery('whitelist_remove', ('bigint', 'bigint'), """
+        DELETE FROM whitelist WHERE guild_id = %s AND user_id = %s
+    """),
+    NamedQuery('whitelist_bump_version', (), """
+        UPDATE whitelist_meta SET version = version + 1 RETURNING version
+    """),
+    NamedQuery('notify_whitelist', ('text',), """
+        SELECT pg_notify('whitelist', %s)
+    """),
+    NamedQuery('mark_write_applied', ('text',), """
+        INSERT INTO applied_writes (write_id) VALUES (%s)
+        ON CONFLICT DO NOTHING
+    """),
+    NamedQuery('record_timeout', ('text', 'boolean', 'bigint', 'bigint'), """
+        UPDATE alt_detections SET action_taken = %s, timed_out = %s
+        WHERE guild_id = %s AND user_id = %s AND action_taken = 'timeout_queued'
+        AND detected_at >= CURRENT_TIMESTAMP - INTERVAL '1 day'
+    """),
+    NamedQuery('set_log_channel', ('bigint', 'bigint'), """
+        INSERT INTO guild_settings (guild_id, log_channel_id)
+        VALUES (%s, %s)
+        ON CONFLICT (guild_id) DO UPDATE SET log_channel_id = EXCLUDED.log_channel_id
+    """),
+    NamedQuery('get_alt_detections', ('bigint', 'integer'), """
+        SELECT * FROM alt_detections
+        WHERE guild_id = %s
+        ORDER BY detected_at DESC
+        LIMIT %s
+    """),
+    NamedQuery('get_scan', ('bigint',), """
+        SELECT * FROM scan_progress WHERE guild_id = %s
+    """),
+    NamedQuery('finish_scan', ('text', 'bigint'), """
+        UPDATE scan_progress SET status = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE guild_id = %s
+    """),
+    NamedQuery('get_scan_results', ('bigint', 'integer'), """
+        SELECT * FROM scan_results
+        WHERE guild_id = %s
+        ORDER BY suspicion_score DESC, user_id
+        LIMIT %s
+    """),
+)
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """A pooled connection that remembers which named queries it has prepared"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
 class Database:
-    """PostgreSQL database handler"""
+    """PostgreSQL database handler (pooled, queries run off the event loop)"""
+    
+    SCHEMA_LOCK_ID = 72511  # advisory lock held while creating tables
     
     def __init__(self):
-        self.conn = None
-        self.connect()
-        self.create_tables()
+        self.pool = None
+        self.detections_partitioned = False
+        # One worker per pooled connection, so a query never waits on the pool
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.DB_POOL_MAX,
+            thread_name_prefix='db'
+        )
+        self.stats = {'queries': 0, 'failed': 0, 'timeouts': 0, 'total_ms': 0.0}
+        self.tables_ready = False
+        self.down_since = None  # set while the database is unreachable
+        self.on_reconnect = []  # coroutines to run once it is back
+        self._reconnect_task = None
     
-    def connect(self):
-        """Connect to PostgreSQL"""
+    async def connect(self):
+        """Connect to PostgreSQL and create tables"""
+        if not Config.DATABASE_URL:
+            logger.warning('⚠️ No DATABASE_URL found!')
+            return
+        
+        loop = asyncio.get_running_loop()
         try:
-            if not Config.DATABASE_URL:
-                logger.warning('⚠️ No DATABASE_URL found!')
-                return
-            
-            result = urlparse(Config.DATABASE_URL)
-            self.conn = psycopg2.connect(
-                database=result.path[1:],
-                user=result.username,
-                password=result.password,
-                host=result.hostname,
-                port=result.port
-            )
-            logger.info('✅ Connected to PostgreSQL!')
+            self.pool = await loop.run_in_executor(self.executor, self._create_pool)
+            logger.info(f'✅ Connected to PostgreSQL! (pool size {Config.DB_POOL_MAX})')
         except Exception as e:
             logger.error(f'❌ Database connection failed: {e}')
-    
-    def create_tables(self):
-        """Create all database tables"""
-        if not self.conn:
+            metrics.exceptions.inc('db_connect')
+            self.mark_down(e)
             return
         
+        await self.create_tables()
+    
+    @property
+    def available(self) -> bool:
+        """Connected and not known to be down"""
+        return self.pool is not None and self.down_since is None
+    
+    @staticmethod
+    def is_connection_error(error: Exception) -> bool:
+        """Whether an error means the connection (not the query) failed"""
+        return (isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+                and not isinstance(error, psycopg2.extensions.QueryCanceledError))
+    
+    def mark_down(self, error: Exception):
+        """Stop sending queries and reconnect in the background"""
+        if self.down_since is None:
+            self.down_since = time.time()
+            logger.error(f'❌ Database unavailable, reconnecting in the background: {error}')
+        if not self._reconnect_task:
+            self._reconnect_task = spawn(self._reconnect())
+    
+    async def _reconnect(self):
+        """Open a fresh pool, backing off exponentially, then run the on_reconnect hooks"""
+        loop = asyncio.get_running_loop()
+        delay = Config.DB_RECONNECT_MIN
         try:
-            cur = self.conn.cursor()
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    pool = await loop.run_in_executor(self.executor, self._create_pool)
+                    break
+                except Exception as e:
+                    delay = min(delay * 2, Config.DB_RECONNECT_MAX)
+                    logger.warning(f'⚠️ Database reconnect failed, retrying in {delay}s: {e}')
+                    metrics.exceptions.inc('db_reconnect')
+            
+            # Swap the pool so no connection from before the outage is reused
+            old, self.pool = self.pool, pool
+            if old:
+                try:
+                    await loop.run_in_executor(self.executor, old.closeall)
+                except Exception:
+                    pass
+        finally:
+            self._reconnect_task = None
+        
+        logger.info(f'✅ Reconnected to PostgreSQL after {time.time() - self.down_since:.0f}s')
+        self.down_since = None
+        if not self.tables_ready:
+            await self.create_tables()
+        for coro in self.on_reconnect:
+            try:
+                await coro()
+            except Exception as e:
+                logger.error(f'Post-reconnect resync failed: {e}')
+                metrics.exceptions.inc('db_resync')
+    
+    def connect_params(self) -> dict:
+        """psycopg2.connect() arguments from DATABASE_URL"""
+        result = urlparse(Config.DATABASE_URL)
+        return {
+            'database': result.path[1:],
+            'user': result.username,
+            'password': result.password,
+            'host': result.hostname,
+            'port': result.port
+        }
+    
+    def _create_pool(self) -> ThreadedConnectionPool:
+        """Open the connection pool (blocking, runs in the executor)"""
+        statement_timeout = int(Config.DB_QUERY_TIMEOUT * 1000)
+        return ThreadedConnectionPool(
+            Config.DB_POOL_MIN,
+            Config.DB_POOL_MAX,
+            # Let Postgres abandon queries we have already given up on
+            options=f'-c statement_timeout={statement_timeout}',
+            connection_factory=PreparingConnection,
+            **self.connect_params()
+        )
+    
+    async def close(self):
+        """Close all pooled connections"""
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+        if self.pool:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self.pool.closeall)
+            self.pool = None
+        self.executor.shutdown(wait=False)
+    
+    async def create_tables(self):
+        """Create all database tables"""
+        def create(cur):
+            # Concurrent CREATE ... IF NOT EXISTS can still collide in the catalog,
+            # so processes starting together take turns (released at commit)
+            cur.execute('SELECT pg_advisory_xact_lock(%s)', (self.SCHEMA_LOCK_ID,))
             
             # Alt detections table
+            if Config.PARTITION_DETECTIONS:
+                # Monthly partitions (see DataManager.ensure_partitions), so
+                # retention can drop a whole month at once
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS alt_detections (
+                        id SERIAL,
+                        {ALT_DETECTION_COLUMNS},
+                        PRIMARY KEY (id, detected_at)
+                    ) PARTITION BY RANGE (detected_at)
+                """)
+            else:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS alt_detections (
+                        id SERIAL PRIMARY KEY,
+                        {ALT_DETECTION_COLUMNS}
+                    )
+                """)
+            
             cur.execute("""
-                CREATE TABLE IF NOT EXISTS alt_detections (
-                    id SERIAL PRIMARY KEY,
-                    guild_id BIGINT NOT NULL,
-                    user_id BIGINT NOT NULL,
-                    username TEXT,
-                    suspicion_score INTEGER,
-                    suspicion_level TEXT,
-                    reasons TEXT[],
-                    similar_to_user_id BIGINT,
-                    similar_to_username TEXT,
-                    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    action_taken TEXT,
-                    kicked BOOLEAN DEFAULT FALSE,
-                    timed_out BOOLEAN DEFAULT FALSE
-                )
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_partitioned_table
+                    WHERE partrelid = 'alt_detections'::regclass
+                ) AS partitioned
             """)
+            partitioned = cur.fetchone()['partitioned']
+            if partitioned:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS alt_detections_default
+                    PARTITION OF alt_detections DEFAULT
+                """)
+            
+            if Config.ARCHIVE_DETECTIONS:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS alt_detections_archive
+                    (LIKE alt_detections)
+                """)
             
             # User tracking table
             cur.execute("""
@@ -156,6 +620,29 @@ class Database:
                 )
             """)
             
+            # Indexes for per-guild history, stats and recent join lookups
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_alt_detections_guild_detected
+                ON alt_detections (guild_id, detected_at DESC)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_user_tracking_guild_joined
+                ON user_tracking (guild_id, last_joined_at)
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS idx_user_tracking_joined
+                ON user_tracking (last_joined_at)
+            """)
+            
+            # Whitelist version, bumped on every change so processes can spot drift
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS whitelist_meta (
+                    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                    version BIGINT NOT NULL DEFAULT 0
+                )
+            """)
+            cur.execute("INSERT INTO whitelist_meta (id) VALUES (1) ON CONFLICT DO NOTHING")
+            
             # Guild settings table
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS guild_settings (
@@ -167,134 +654,1333 @@ class Database:
                     log_channel_id BIGINT
                 )
             """)
+            cur.execute("""
+                ALTER TABLE guild_settings
+                ADD COLUMN IF NOT EXISTS retention_days INTEGER,
+                ADD COLUMN IF NOT EXISTS rule_overrides JSONB
+            """)
+            
+            # Member scans (!scanserver): one resumable checkpoint per guild, plus its findings
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS scan_progress (
+                    guild_id BIGINT PRIMARY KEY,
+                    status TEXT DEFAULT 'running',
+                    last_user_id BIGINT DEFAULT 0,
+                    scanned INTEGER DEFAULT 0,
+                    flagged INTEGER DEFAULT 0,
+                    started_by BIGINT,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS scan_results (
+                    guild_id BIGINT,
+                    user_id BIGINT,
+                    username TEXT,
+                    suspicion_score INTEGER,
+                    suspicion_level TEXT,
+                    reasons TEXT[],
+                    similar_to_user_id BIGINT,
+                    similar_to_username TEXT,
+                    scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (guild_id, user_id)
+                )
+            """)
             
-            self.conn.commit()
-            cur.close()
+            # Ids of applied writes, so a journaled copy of a write that
+            # timed out (but still committed) isn't applied twice
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS applied_writes (
+                    write_id TEXT PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            return partitioned
+        
+        try:
+            self.detections_partitioned = await self.run(create, timeout=30)
+            self.tables_ready = True
             logger.info('✅ Database tables ready!')
         except Exception as e:
             logger.error(f'❌ Failed to create tables: {e}')
+            metrics.exceptions.inc('create_tables')
+            return
+        
+        if Config.PARTITION_DETECTIONS and not self.detections_partitioned:
+            logger.warning('⚠️ alt_detections already exists unpartitioned, retention will use batched deletes')
     
-    def execute(self, query: str, params: tuple = None, fetch: bool = False):
-        """Execute database query"""
-        if not self.conn:
+    def _run(self, fn):
+        """Run fn(cursor) on a pooled connection and commit (executor thread)"""
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                result = fn(cur)
+            finally:
+                cur.close()
+            conn.commit()
+            return result
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken or conn.closed != 0)
+    
+    async def run(self, fn, timeout: float = None, name: str = None):
+        """Run fn(cursor) in one transaction without blocking the event loop"""
+        if not self.available:
             return None
         
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.stats['queries'] += 1
         try:
-            cur = self.conn.cursor(cursor_factory=RealDictCursor)
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self._run, fn),
+                timeout or Config.DB_QUERY_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            if self.is_connection_error(e):
+                self.mark_down(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats['total_ms'] += elapsed * 1000
+            metrics.db_queries.observe(elapsed, name or fn.__qualname__.replace('.<locals>', ''))
+    
+    async def ping(self) -> bool:
+        """Whether a pooled connection answers SELECT 1"""
+        try:
+            return bool(await self.run(
+                lambda cur: cur.execute('SELECT 1') or True,
+                timeout=Config.READY_DB_TIMEOUT, name='ping'
+            ))
+        except Exception as e:
+            logger.warning(f'Database ping failed: {e}')
+            metrics.exceptions.inc('db_ping')
+            return False
+    
+    @staticmethod
+    def run_named(cur, name: str, params: tuple = ()):
+        """Execute a NAMED_QUERIES statement on cur, preparing it on first use per connection"""
+        query = NAMED_QUERIES[name]
+        prepared = getattr(cur.connection, 'prepared', None)
+        if prepared is None or not Config.DB_PREPARE_STATEMENTS:
+            cur.execute(query.sql, params)
+            return
+        
+        if name not in prepared:
+            cur.execute(query.prepare)
+            prepared.add(name)
+        try:
+            cur.execute(query.execute, params)
+        except psycopg2.Error as e:
+            if e.pgcode == '26000':  # invalid_sql_statement_name: prepare again next time
+                prepared.discard(name)
+            raise
+    
+    async def execute_named(self, name: str, params: tuple = (), fetch: bool = False,
+                            timeout: float = None):
+        """Execute a named query (timed under its own name)"""
+        def work(cur):
+            self.run_named(cur, name, params)
+            return cur.fetchall() if fetch else True
+        
+        try:
+            return await self.run(work, timeout, name)
+        except asyncio.TimeoutError:
+            logger.error(f'Query {name} timed out')
+            metrics.exceptions.inc('db_timeout')
+            return None
+        except Exception as e:
+            logger.error(f'Query {name} failed: {e}')
+            metrics.exceptions.inc('db_query')
+            return None
+    
+    _query_names = {}
+    
+    @classmethod
+    def query_name(cls, query: str) -> str:
+        """Metric label for raw SQL: its verb and first table, e.g. 'select alt_detections'"""
+        name = cls._query_names.get(query)
+        if name is None:
+            words = query.split()
+            verb = words[0].lower() if words else 'query'
+            table = next(
+                (words[i + 1] for i, word in enumerate(words[:-1])
+                 if word.upper() in ('FROM', 'INTO', 'UPDATE', 'TABLE')),
+                ''
+            )
+            name = cls._query_names[query] = f'{verb} {table.strip("(;").lower()}'.strip()
+        return name
+    
+    async def execute(self, query: str, params: tuple = None, fetch: bool = False,
+                      timeout: float = None):
+        """Execute database query"""
+        def work(cur):
             cur.execute(query, params)
-            
-            if fetch:
-                result = cur.fetchall()
-                cur.close()
-                return result
-            else:
-                self.conn.commit()
-                cur.close()
-                return True
+            return cur.fetchall() if fetch else True
+        
+        try:
+            return await self.run(work, timeout, self.query_name(query))
+        except asyncio.TimeoutError:
+            logger.error('Query timed out')
+            metrics.exceptions.inc('db_timeout')
+            return None
         except Exception as e:
             logger.error(f'Query failed: {e}')
-            if self.conn:
-                self.conn.rollback()
+            metrics.exceptions.inc('db_query')
             return None
 
+class WriteJournal:
+    """
+    Append-only JSON lines file of database writes made while Postgres is down.
+    
+    Entries survive restarts and are replayed in the order they were written;
+    the file is removed once everything in it has been applied.
+    """
+    
+    # Entry layout version, stored in each entry; bump it when the layout changes
+    # and keep _apply_entry able to replay the older ones
+    FORMAT = 1
+    
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.pending = 0  # entries in the file
+        self.size = 0
+        self.lock = asyncio.Lock()
+        self.stats = {'journaled': 0, 'replayed': 0, 'dropped': 0}
+        self._full_logged = False
+    
+    def load(self):
+        """Count entries left over from a previous run"""
+        try:
+            with open(self.path, 'rb') as f:
+                self.pending = sum(1 for line in f if line.strip())
+            self.size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+        if self.pending:
+            logger.warning(f'⚠️ {self.pending} journaled writes are waiting for the database')
+    
+    async def append(self, entry: dict) -> bool:
+        """Durably add one entry; False if it could not be kept"""
+        line = (json.dumps(entry, default=str) + '\n').encode()
+        async with self.lock:
+            if self.size + len(line) > self.max_bytes:
+                if not self._full_logged:
+                    self._full_logged = True
+                    logger.error(f'❌ Write journal is full ({self.size} bytes), dropping writes')
+                self.stats['dropped'] += 1
+                return False
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._append, line)
+            except OSError as e:
+                logger.error(f'❌ Failed to journal a write: {e}')
+                metrics.exceptions.inc('journal_append')
+                return False
+            self.pending += 1
+            self.size += len(line)
+            self.stats['journaled'] += 1
+        return True
+    
+    def _append(self, line: bytes):
+        with open(self.path, 'ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _read(self) -> List[dict]:
+        entries = []
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A write cut short by a crash
+                    logger.warning('⚠️ Skipping a torn write journal line')
+                    metrics.exceptions.inc('journal_load')
+        return entries
+    
+    def _rewrite(self, entries: List[dict]) -> int:
+        """Keep only `entries` (atomically); returns the new file size"""
+        if not entries:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            return 0
+        
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            for entry in entries:
+                f.write((json.dumps(entry, default=str) + '\n').encode())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        return os.path.getsize(self.path)
+    
+    async def replay(self, apply) -> bool:
+        """Await apply(entry) for each entry in order until one returns False; True once empty"""
+        async with self.lock:
+            if not self.pending:
+                return True
+            
+            loop = asyncio.get_running_loop()
+            entries = await loop.run_in_executor(None, self._read)
+            done = 0
+            for entry in entries:
+                if not await apply(entry):
+                    break
+                done += 1
+            
+            self.size = await loop.run_in_executor(None, self._rewrite, entries[done:])
+            self.pending = len(entries) - done
+            self.stats['replayed'] += done
+            self._full_logged = False
+        
+        if done:
+            logger.info(f'✅ Replayed {done} journaled writes ({self.pending} left)')
+        return not self.pending
+
+class PgListener:
+    """Dedicated LISTEN connection that hands NOTIFY payloads to callbacks"""
+    
+    def __init__(self, db: 'Database'):
+        self.db = db
+        self.conn = None
+        self.handlers = {}  # channel: callback(payload)
+        self.resync = []  # coroutines to run after a reconnect (notifies may be lost)
+        self._restarting = False
+    
+    def on(self, channel: str, handler):
+        self.handlers[channel] = handler
+    
+    async def start(self) -> bool:
+        """Connect and LISTEN on every registered channel"""
+        if not Config.DATABASE_URL:
+            return False
+        
+        loop = asyncio.get_running_loop()
+        try:
+            self.conn = await loop.run_in_executor(self.db.executor, self._connect)
+        except Exception as e:
+            logger.error(f'❌ LISTEN connection failed: {e}')
+            metrics.exceptions.inc('listen_connect')
+            return False
+        
+        loop.add_reader(self.conn.fileno(), self._on_readable)
+        logger.info(f'✅ Listening for {", ".join(self.handlers)} changes')
+        return True
+    
+    def _connect(self):
+        conn = psycopg2.connect(**self.db.connect_params())
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        for channel in self.handlers:
+            cur.execute(f'LISTEN {channel}')
+        cur.close()
+        return conn
+    
+    def _on_readable(self):
+        try:
+            self.conn.poll()
+        except psycopg2.Error as e:
+            logger.error(f'LISTEN connection lost: {e}')
+            metrics.exceptions.inc('listen_lost')
+            self._drop()
+            if not self._restarting:
+                self._restarting = True
+                spawn(self._restart())
+            return
+        
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            handler = self.handlers.get(notify.channel)
+            if not handler:
+                continue
+            try:
+                handler(notify.payload)
+            except Exception as e:
+                logger.error(f'NOTIFY handler for {notify.channel} failed: {e}')
+                metrics.exceptions.inc('notify_handler')
+    
+    async def _restart(self):
+        """Reconnect, then let caches resync whatever was missed meanwhile"""
+        try:
+            while not await self.start():
+                await asyncio.sleep(Config.LISTEN_RETRY_DELAY)
+            for coro in self.resync:
+                await coro()
+        finally:
+            self._restarting = False
+    
+    def _drop(self):
+        if self.conn:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
+    
+    async def close(self):
+        if self.conn:
+            self._drop()
+
+class GuildSettings:
+    """Per-guild alt detection settings, cached in memory over guild_settings"""
+    
+    # Setting name used by !altconfig: (column, parser)
+    EDITABLE = {
+        'enabled': ('alt_detection_enabled', 'bool'),
+        'autotimeout': ('auto_timeout_alts', 'bool'),
+        'timeout': ('timeout_duration', 'int'),
+        'minage': ('min_account_age', 'int'),
+        'retention': ('retention_days', 'int'),
+    }
+    # Accepted range for each int setting (Discord caps timeouts at 28 days)
+    LIMITS = {
+        'timeout': (1, 40320),  # minutes
+        'minage': (1, 3650),  # days
+        'retention': (1, 3650),  # days
+        'points': (0, 100),  # per rule; 0 turns it off
+        'threshold': (1, 500),  # level minimum; reachable with every rule at 100
+    }
+    
+    def __init__(self, db: 'Database'):
+        self.db = db
+        self.cache = {}  # guild_id: (settings, loaded_at)
+        self.loading = set()  # guild_ids with a background load in flight
+    
+    @staticmethod
+    def defaults() -> dict:
+        return {
+            'alt_detection_enabled': True,
+            'auto_timeout_alts': Config.AUTO_TIMEOUT_ALTS,
+            'timeout_duration': Config.TIMEOUT_DURATION,
+            'min_account_age': Config.MIN_ACCOUNT_AGE,
+            'retention_days': None,
+            'rule_overrides': {},
+        }
+    
+    def _store(self, row: dict):
+        settings = self.defaults()
+        settings.update({key: row[key] for key in settings if row.get(key) is not None})
+        self.cache[row['guild_id']] = (settings, time.monotonic())
+    
+    async def load_all(self):
+        """Load every guild's settings in one query"""
+        result = await self.db.execute("SELECT * FROM guild_settings", fetch=True)
+        if result is None:
+            return
+        for row in result:
+            if owns_guild(row['guild_id']):
+                self._store(row)
+        logger.info(f'✅ Loaded settings for {len(self.cache)} guilds')
+    
+    async def refresh(self, guild_id: int):
+        """Reload one guild's settings (no row means defaults)"""
+        try:
+            result = await self.db.execute(
+                "SELECT * FROM guild_settings WHERE guild_id = %s", (guild_id,), fetch=True
+            )
+            if result is None:
+                # Database unavailable: keep what we have, or defaults until the next TTL
+                if guild_id not in self.cache:
+                    self._store({'guild_id': guild_id})
+                return
+            self._store(result[0] if result else {'guild_id': guild_id})
+        finally:
+            self.loading.discard(guild_id)
+    
+    def get(self, guild_id: int) -> dict:
+        """Settings for a guild without touching the database
+        
+        A missing or expired entry is reloaded in the background; until then
+        the cached value (or the defaults) is returned.
+        """
+        entry = self.cache.get(guild_id)
+        if (not entry or time.monotonic() - entry[1] > Config.SETTINGS_TTL) and guild_id not in self.loading:
+            self.loading.add(guild_id)
+            spawn(self.refresh(guild_id))
+        return entry[0] if entry else self.defaults()
+    
+    async def update(self, guild_id: int, column: str, value, merge: bool = False) -> bool:
+        """Write a setting through to Postgres, the cache and other processes
+        
+        With merge=True the value is a dict merged into the column's JSONB object.
+        """
+        payload = json.dumps({'guild_id': guild_id, 'origin': INSTANCE_ID})
+        new_value = f"COALESCE(guild_settings.{column}, '{{}}'::jsonb) || EXCLUDED.{column}" if merge else f"EXCLUDED.{column}"
+        
+        def write(cur):
+            # Column names come from EDITABLE, never from user input
+            cur.execute(f"""
+                INSERT INTO guild_settings (guild_id, {column})
+                VALUES (%s, %s)
+                ON CONFLICT (guild_id) DO UPDATE SET {column} = {new_value}
+            """, (guild_id, Json(value) if merge else value))
+            cur.execute("SELECT pg_notify('guild_settings', %s)", (payload,))
+            return True
+        
+        try:
+            if not await self.db.run(write):
+                return False
+        except Exception as e:
+            logger.error(f'Failed to update settings: {e}')
+            metrics.exceptions.inc('settings_update')
+            return False
+        
+        settings = dict(self.get(guild_id))
+        settings[column] = {**settings[column], **value} if merge else value
+        self.cache[guild_id] = (settings, time.monotonic())
+        return True
+    
+    def handle_notify(self, payload: str):
+        """Another process changed a guild's settings"""
+        message = json.loads(payload)
+        if message['origin'] != INSTANCE_ID and owns_guild(message['guild_id']):
+            self.cache.pop(message['guild_id'], None)
+            self.get(message['guild_id'])
+
+DETECTION_COUNT_KEYS = ('total', 'critical', 'high', 'medium', 'low', 'timed_out', 'kicked')
+
 class DataManager:
     """Manages all bot data"""
     
     def __init__(self):
         self.db = Database()
         self.whitelist_cache = defaultdict(set)
-        self.load_whitelist()
+        self.whitelist_version = None  # whitelist_meta version the cache is known to match
+        self.log_channels = {}  # guild_id: log channel id
+        self.settings = GuildSettings(self.db)
+        self.listener = PgListener(self.db)
+        self.listener.on('guild_settings', self.settings.handle_notify)
+        self.listener.on('whitelist', self._on_whitelist_notify)
+        self.listener.resync.append(self.settings.load_all)
+        self.listener.resync.append(self.check_whitelist)
+        journal_root, journal_ext = os.path.splitext(Config.DB_JOURNAL_PATH)
+        self.journal = WriteJournal(f'{journal_root}-{Config.CLUSTER_ID}{journal_ext}', Config.DB_JOURNAL_MAX_BYTES)
+        self.db.on_reconnect.append(self.resync_after_outage)
+        
+        # Write-behind queue for joins and detections
+        self.pending_joins = {}  # (user_id, guild_id): upsert row
+        self.pending_detections = []
+        self.flush_lock = asyncio.Lock()
+        self.write_stats = {'flushes': 0, 'rows': 0, 'dropped': 0, 'last_flush_ms': 0.0}
+        self._flush_task = None
+        self._whitelist_task = None
+        
+        # guild_id: {'total', 'critical', ..., 'timed_out', 'kicked'}
+        self.detection_counts = defaultdict(lambda: defaultdict(int))
+    
+    async def setup(self):
+        """Connect to the database and warm caches"""
+        self.journal.load()
+        await self.db.connect()
+        # Writes journaled before a restart land before anything is read back
+        await self.replay_journal()
+        await self.load_whitelist()
+        await self.load_log_channels()
+        await self.settings.load_all()
+        await self.load_detection_counts()
+        await self.ensure_partitions()
+        await self.listener.start()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._whitelist_task = asyncio.create_task(self._whitelist_check_loop())
+    
+    async def resync_after_outage(self):
+        """Replay journaled writes, then reload whatever the caches missed while the database was down"""
+        await self.replay_journal()
+        if not self.listener.conn and not self.listener._restarting:
+            await self.listener.start()
+        await self.check_whitelist(full=True)  # replay may have dropped whitelist writes
+        await self.load_log_channels()
+        await self.settings.load_all()
+        await self.load_detection_counts()
     
-    def load_whitelist(self):
+    async def close(self):
+        """Flush queued writes and release database resources"""
+        for task in (self._flush_task, self._whitelist_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        # Waits on flush_lock for any flush still running, then writes the rest
+        await self.flush()
+        await self.listener.close()
+        await self.db.close()
+    
+    async def load_whitelist(self):
         """Load whitelist into cache"""
-        result = self.db.execute("SELECT guild_id, user_id FROM whitelist", fetch=True)
+        result = await self.db.execute("""
+            SELECT m.version, w.guild_id, w.user_id
+            FROM whitelist_meta m LEFT JOIN whitelist w ON TRUE
+        """, fetch=True)
+        if result:
+            for row in result:
+                if row['guild_id'] is not None and owns_guild(row['guild_id']):
+                    self.whitelist_cache[row['guild_id']].add(row['user_id'])
+            self.whitelist_version = result[0]['version']
+    
+    def _on_whitelist_notify(self, payload: str):
+        """Apply a whitelist change announced by any process (including this one)"""
+        message = json.loads(payload)
+        # Only advance on the next version; after a gap the next check_whitelist verifies the cache
+        if self.whitelist_version is not None and message['version'] == self.whitelist_version + 1:
+            self.whitelist_version = message['version']
+        if not owns_guild(message['guild_id']):
+            return
+        if message['op'] == 'add':
+            self.whitelist_cache[message['guild_id']].add(message['user_id'])
+        else:
+            self.whitelist_cache[message['guild_id']].discard(message['user_id'])
+    
+    @staticmethod
+    def _whitelist_checksum(guild_id: int, user_ids) -> int:
+        """Order-independent checksum, matching the SQL in check_whitelist"""
+        return sum((guild_id ^ user_id) % 1000000007 for user_id in user_ids)
+    
+    async def check_whitelist(self, full: bool = False):
+        """Compare per-guild checksums with Postgres and reload only guilds that drifted"""
+        meta = await self.db.execute("SELECT version FROM whitelist_meta", fetch=True)
+        if not meta:
+            return
+        version = meta[0]['version']
+        if version == self.whitelist_version and not full:
+            return  # every change since the cache was verified has been applied
+        
+        result = await self.db.execute("""
+            SELECT guild_id, COUNT(*) AS members,
+                   SUM((guild_id # user_id) % 1000000007) AS checksum,
+                   (SELECT version FROM whitelist_meta) AS version
+            FROM whitelist
+            GROUP BY guild_id
+        """, fetch=True)
+        if result is None:
+            return
+        if result:
+            version = result[0]['version']
+        
+        remote = {
+            row['guild_id']: (row['members'], int(row['checksum']))
+            for row in result if owns_guild(row['guild_id'])
+        }
+        drifted = [
+            guild_id for guild_id in set(remote) | set(self.whitelist_cache)
+            if remote.get(guild_id, (0, 0)) != (
+                len(self.whitelist_cache.get(guild_id, ())),
+                self._whitelist_checksum(guild_id, self.whitelist_cache.get(guild_id, ()))
+            )
+        ]
+        if not drifted:
+            self.whitelist_version = version
+            return
+        
+        rows = await self.db.execute("""
+            SELECT guild_id, user_id FROM whitelist WHERE guild_id = ANY(%s)
+        """, (drifted,), fetch=True)
+        if rows is None:
+            return
+        
+        fresh = defaultdict(set)
+        for row in rows:
+            fresh[row['guild_id']].add(row['user_id'])
+        for guild_id in drifted:
+            self.whitelist_cache[guild_id] = fresh[guild_id]
+        self.whitelist_version = version
+        logger.warning(f'⚠️ Whitelist drifted in {len(drifted)} guild(s), reloaded them')
+    
+    async def _whitelist_check_loop(self):
+        checks = 0
+        while True:
+            await asyncio.sleep(Config.WHITELIST_CHECK_INTERVAL)
+            checks += 1
+            # Now and then checksum anyway: a lost or dropped write leaves the version unchanged
+            await self.check_whitelist(full=checks % Config.WHITELIST_FULL_CHECK_EVERY == 0)
+    
+    async def _write_whitelist(self, op: str, guild_id: int, user_id: int, query_name: str, params: tuple):
+        """Change the whitelist and announce it (with a new version) in one transaction"""
+        return await self._write_or_journal({
+            'kind': 'whitelist', 'op': op, 'guild_id': guild_id, 'user_id': user_id,
+            'query': query_name, 'params': list(params)
+        }, 'DataManager.write_whitelist')
+    
+    def _apply_whitelist(self, cur, entry: dict):
+        self.db.run_named(cur, entry['query'], entry['params'])
+        if not cur.rowcount:
+            return True
+        self.db.run_named(cur, 'whitelist_bump_version')
+        payload = json.dumps({
+            'op': entry['op'], 'guild_id': entry['guild_id'], 'user_id': entry['user_id'],
+            'version': cur.fetchone()['version']
+        })
+        self.db.run_named(cur, 'notify_whitelist', (payload,))
+        return True
+    
+    def _apply_entry(self, cur, entry: dict):
+        """Apply one write (live or journaled) in the current transaction"""
+        self.db.run_named(cur, 'mark_write_applied', (entry['id'],))
+        if not cur.rowcount:
+            return True  # an attempt that timed out on our side committed it
+        if entry['kind'] == 'whitelist':
+            return self._apply_whitelist(cur, entry)
+        if entry['kind'] == 'timeout':
+            self.db.run_named(cur, 'record_timeout', (
+                'timeout' if entry['applied'] else 'timeout_failed', entry['applied'],
+                entry['guild_id'], entry['user_id']
+            ))
+            return True
+        return self._write_rows(cur, entry['joins'], entry['detections'])
+    
+    async def _write_or_journal(self, entry: dict, name: str) -> bool:
+        """Write now, or journal the write while the database is down; False if it was lost"""
+        if not Config.DATABASE_URL and self.db.pool is None:
+            return True  # no database configured, nothing to write to
+        entry['format'] = WriteJournal.FORMAT
+        entry['id'] = uuid.uuid4().hex
+        
+        # Older journaled writes go first, so nothing is applied out of order
+        if self.journal.pending and self.db.available:
+            await self.replay_journal()
+        if self.db.available and not self.journal.pending:
+            try:
+                if await self.db.run(lambda cur: self._apply_entry(cur, entry), name=name):
+                    return True
+            except Exception as e:
+                logger.error(f'Write failed, journaling it: {e}')
+                metrics.exceptions.inc('db_write')
+        return await self.journal.append(entry)
+    
+    async def replay_journal(self) -> bool:
+        """Apply journaled writes in order; True once the journal is empty"""
+        if not self.journal.pending:
+            return True
+        if not self.db.available:
+            return False
+        
+        async def apply(entry: dict) -> bool:
+            """True once the entry is applied or dropped, False to stop and retry it later"""
+            try:
+                return bool(await self.db.run(
+                    lambda cur: self._apply_entry(cur, entry), name='DataManager.replay_journal'
+                ))
+            except asyncio.TimeoutError:
+                return False
+            except Exception as e:
+                if not self.db.available or self.db.is_connection_error(e):
+                    return False
+                # Postgres is up, so this entry can never apply (rejected or malformed);
+                # don't let it block everything journaled after it
+                logger.error(f'❌ Dropping a journaled write that cannot be applied: {e}')
+                self.journal.stats['dropped'] += 1
+                metrics.exceptions.inc('journal_replay')
+                return True
+        
+        return await self.journal.replay(apply)
+    
+    async def load_log_channels(self):
+        """Load saved log channel ids into cache"""
+        result = await self.db.execute("""
+            SELECT guild_id, log_channel_id FROM guild_settings
+            WHERE log_channel_id IS NOT NULL
+        """, fetch=True)
         if result:
             for row in result:
-                self.whitelist_cache[row['guild_id']].add(row['user_id'])
+                if owns_guild(row['guild_id']):
+                    self.log_channels[row['guild_id']] = row['log_channel_id']
+    
+    async def set_log_channel(self, guild_id: int, channel_id: Optional[int]):
+        """Remember a guild's log channel (None forgets it)"""
+        if channel_id:
+            self.log_channels[guild_id] = channel_id
+        else:
+            self.log_channels.pop(guild_id, None)
+        return await self.db.execute_named('set_log_channel', (guild_id, channel_id))
     
     def is_whitelisted(self, guild_id: int, user_id: int) -> bool:
         """Check if user is whitelisted"""
         return user_id in self.whitelist_cache.get(guild_id, set())
     
-    def add_to_whitelist(self, guild_id: int, user_id: int, added_by: int, reason: str = 'No reason'):
-        """Add user to whitelist"""
+    async def add_to_whitelist(self, guild_id: int, user_id: int, added_by: int, reason: str = 'No reason'):
+        """Add user to whitelist; False if the change could not be saved"""
+        if not await self._write_whitelist(
+            'add', guild_id, user_id, 'whitelist_add', (guild_id, user_id, added_by, reason)
+        ):
+            return False
         self.whitelist_cache[guild_id].add(user_id)
-        return self.db.execute("""
-            INSERT INTO whitelist (guild_id, user_id, added_by, reason)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT DO NOTHING
-        """, (guild_id, user_id, added_by, reason))
-    
-    def remove_from_whitelist(self, guild_id: int, user_id: int):
-        """Remove user from whitelist"""
+        return True
+    
+    async def remove_from_whitelist(self, guild_id: int, user_id: int):
+        """Remove user from whitelist; False if the change could not be saved"""
+        if not await self._write_whitelist(
+            'remove', guild_id, user_id, 'whitelist_remove', (guild_id, user_id)
+        ):
+            return False
         self.whitelist_cache[guild_id].discard(user_id)
-        return self.db.execute("""
-            DELETE FROM whitelist WHERE guild_id = %s AND user_id = %s
-        """, (guild_id, user_id))
-    
-    def save_alt_detection(self, guild_id: int, user_id: int, username: str,
-                          score: int, level: str, reasons: List[str],
-                          similar_to: int = None, similar_username: str = None,
-                          action: str = 'none'):
-        """Save alt detection"""
-        return self.db.execute("""
-            INSERT INTO alt_detections 
-            (guild_id, user_id, username, suspicion_score, suspicion_level, 
-             reasons, similar_to_user_id, similar_to_username, action_taken,
-             kicked, timed_out)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (guild_id, user_id, username, score, level, reasons,
-              similar_to, similar_username, action,
-              action == 'kicked', action == 'timeout'))
-    
-    def track_user_join(self, guild_id: int, member: discord.Member):
-        """Track user join"""
-        return self.db.execute("""
-            INSERT INTO user_tracking 
-            (user_id, guild_id, username, discriminator, avatar_url, account_created_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (user_id, guild_id) 
-            DO UPDATE SET 
-                last_joined_at = CURRENT_TIMESTAMP,
-                join_count = user_tracking.join_count + 1
-        """, (member.id, guild_id, member.name, member.discriminator,
-              str(member.display_avatar.url) if member.avatar else None,
-              member.created_at))
-    
-    def get_recent_joins(self, guild_id: int, minutes: int = 10):
+        return True
+    
+    async def save_alt_detection(self, guild_id: int, user_id: int, username: str,
+                                 score: int, level: str, reasons: List[str],
+                                 similar_to: int = None, similar_username: str = None,
+                                 action: str = 'none'):
+        """Queue an alt detection for the next bulk write"""
+        row = self._detection_row(
+            guild_id, user_id, username, score, level, reasons,
+            similar_to, similar_username, action
+        )
+        self.pending_detections.append(row)
+        self._count_detection(self.detection_counts, row)
+        metrics.detections.inc(level)
+        self._flush_if_full()
+        return True
+    
+    async def track_user_join(self, guild_id: int, member: discord.Member):
+        """Queue a join for the next bulk write"""
+        self._merge_join(self.pending_joins, guild_id, member)
+        self._flush_if_full()
+        return True
+    
+    async def save_join_batch(self, guild_id: int, members: List[discord.Member],
+                              detections: List[tuple]):
+        """Write a batch of joins and their detections in one transaction"""
+        joins = {}
+        for member in members:
+            self._merge_join(joins, guild_id, member)
+        
+        detection_rows = [
+            self._detection_row(guild_id, m.id, m.name, r['score'], r['level'], r['reasons'],
+                                r['similar_to'], r['similar_username'], action)
+            for m, r, action in detections
+        ]
+        
+        for row in detection_rows:
+            self._count_detection(self.detection_counts, row)
+        for _, result, _ in detections:
+            metrics.detections.inc(result['level'])
+        
+        # Serialised with flushes so counter reconciliation sees a stable table
+        async with self.flush_lock:
+            return await self._write_or_journal(
+                {'kind': 'batch', 'joins': list(joins.values()), 'detections': detection_rows},
+                'DataManager.save_join_batch'
+            )
+    
+    async def record_queued_timeout(self, guild_id: int, user_id: int, applied: bool):
+        """Settle a raid detection's queued timeout once the ActionWorker has tried it"""
+        if applied:
+            self.detection_counts[guild_id]['timed_out'] += 1
+        return await self._write_or_journal({
+            'kind': 'timeout', 'guild_id': guild_id, 'user_id': user_id, 'applied': applied
+        }, 'DataManager.record_queued_timeout')
+    
+    @staticmethod
+    def _merge_join(joins: dict, guild_id: int, member: discord.Member):
+        """Add a join to a pending batch, folding repeat joins into one upsert row"""
+        # Join times are taken now, so a write replayed after an outage keeps them
+        now = time.time()
+        row = joins.get((member.id, guild_id))
+        if row:
+            row[-2] = now
+            row[-1] += 1
+            return
+        
+        joins[(member.id, guild_id)] = [
+            member.id, guild_id, member.name, member.discriminator,
+            str(member.display_avatar.url) if member.avatar else None,
+            member.created_at, now, now, 1
+        ]
+    
+    @staticmethod
+    def _detection_row(guild_id: int, user_id: int, username: str, score: int, level: str,
+                       reasons: List[str], similar_to: int, similar_username: str,
+                       action: str) -> tuple:
+        return (guild_id, user_id, username, score, level, reasons,
+                similar_to, similar_username, action,
+                action == 'kicked', action == 'timeout', time.time())
+    
+    @staticmethod
+    def _count_detection(counts: dict, row: tuple):
+        """Add one detection row to per-guild counters"""
+        guild_counts = counts[row[0]]
+        guild_counts['total'] += 1
+        guild_counts[row[4].lower()] += 1
+        guild_counts['kicked'] += row[9]
+        guild_counts['timed_out'] += row[10]
+    
+    async def load_detection_counts(self) -> bool:
+        """Warm the per-guild detection counters from alt_detections"""
+        async with self.flush_lock:
+            await self._flush_locked()
+            # Journaled detections aren't in the table yet either
+            if not await self.replay_journal():
+                return False
+            result = await self.get_alt_stats()
+            if result is None:
+                return False
+            
+            counts = defaultdict(lambda: defaultdict(int))
+            for row in result:
+                if not owns_guild(row['guild_id']):
+                    continue
+                counts[row['guild_id']].update(
+                    (key, row[key]) for key in DETECTION_COUNT_KEYS
+                )
+            # Anything still queued (a failed flush) is not in the table yet
+            for row in self.pending_detections:
+                self._count_detection(counts, row)
+        
+        drifted = sum(
+            1 for guild_id in set(counts) | set(self.detection_counts)
+            if {k: counts[guild_id][k] for k in DETECTION_COUNT_KEYS}
+            != {k: self.detection_counts[guild_id][k] for k in DETECTION_COUNT_KEYS}
+        )
+        if drifted and self.detection_counts:
+            logger.warning(f'⚠️ Detection counters drifted in {drifted} guild(s), reconciled')
+        self.detection_counts = counts
+        return True
+    
+    def get_detection_counts(self, guild_id: int) -> dict:
+        """All-time detection counters for a guild (no database access)"""
+        guild_counts = self.detection_counts.get(guild_id, {})
+        return {key: guild_counts.get(key, 0) for key in DETECTION_COUNT_KEYS}
+    
+    @staticmethod
+    def _write_rows(cur, join_rows: list, detection_rows: list):
+        """Bulk upsert joins and insert detections (runs in one transaction)"""
+        if join_rows:
+            # Rows are unique per user, so ON CONFLICT never hits a row twice
+            execute_values(cur, """
+                INSERT INTO user_tracking
+                (user_id, guild_id, username, discriminator, avatar_url,
+                 account_created_at, first_joined_at, last_joined_at, join_count)
+                VALUES %s
+                ON CONFLICT (user_id, guild_id)
+                DO UPDATE SET
+                    last_joined_at = GREATEST(user_tracking.last_joined_at, EXCLUDED.last_joined_at),
+                    join_count = user_tracking.join_count + EXCLUDED.join_count
+            """, join_rows, template='(%s, %s, %s, %s, %s, %s, to_timestamp(%s), to_timestamp(%s), %s)',
+                page_size=len(join_rows))
+        
+        if detection_rows:
+            execute_values(cur, """
+                INSERT INTO alt_detections
+                (guild_id, user_id, username, suspicion_score, suspicion_level,
+                 reasons, similar_to_user_id, similar_to_username, action_taken,
+                 kicked, timed_out, detected_at)
+                VALUES %s
+            """, detection_rows, template='(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, to_timestamp(%s))',
+                page_size=len(detection_rows))
+        return True
+    
+    @property
+    def queue_depth(self) -> int:
+        return len(self.pending_joins) + len(self.pending_detections)
+    
+    def _flush_if_full(self):
+        """Start a flush early once a full batch is waiting"""
+        if self.queue_depth >= Config.WRITE_BATCH_SIZE and not self.flush_lock.locked():
+            spawn(self.flush())
+    
+    async def _flush_loop(self):
+        """Flush queued writes every WRITE_FLUSH_INTERVAL"""
+        while True:
+            await asyncio.sleep(Config.WRITE_FLUSH_INTERVAL)
+            # Shielded, so cancelling the loop (close) never abandons a batch mid-write
+            if self.queue_depth:
+                await asyncio.shield(self.flush())
+            elif self.journal.pending and self.db.available:
+                await asyncio.shield(self.replay_journal())
+    
+    async def flush(self) -> bool:
+        """Write every queued join and detection in one transaction"""
+        async with self.flush_lock:
+            return await self._flush_locked()
+    
+    async def _flush_locked(self) -> bool:
+        if not self.queue_depth:
+            return True
+        
+        joins = list(self.pending_joins.values())
+        detections = self.pending_detections
+        self.pending_joins = {}
+        self.pending_detections = []
+        
+        started = time.perf_counter()
+        # While the database is down the batch goes to the journal instead
+        if not await self._write_or_journal(
+            {'kind': 'batch', 'joins': joins, 'detections': detections}, 'DataManager.flush'
+        ):
+            logger.error(f'Write-behind flush failed ({len(joins) + len(detections)} rows)')
+            self._requeue(joins, detections)
+            return False
+        
+        self.write_stats['flushes'] += 1
+        self.write_stats['rows'] += len(joins) + len(detections)
+        self.write_stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return True
+    
+    def _requeue(self, joins: list, detections: list):
+        """Put a failed batch back in front of anything queued since"""
+        for row in joins:
+            pending = self.pending_joins.get((row[0], row[1]))
+            if pending:
+                pending[-3] = row[-3]  # the failed batch holds the earlier first join
+                pending[-1] += row[-1]
+            else:
+                self.pending_joins[(row[0], row[1])] = row
+        self.pending_detections[:0] = detections
+        
+        overflow = len(self.pending_detections) - Config.WRITE_QUEUE_MAX
+        if overflow > 0:
+            del self.pending_detections[:overflow]
+            self.write_stats['dropped'] += overflow
+            logger.warning(f'⚠️ Write queue full, dropped {overflow} detections')
+    
+    async def get_recent_joins(self, guild_id: int, minutes: int = 10):
         """Get recent joins"""
-        return self.db.execute("""
-            SELECT * FROM user_tracking
-            WHERE guild_id = %s 
-            AND last_joined_at >= CURRENT_TIMESTAMP - INTERVAL '%s minutes'
-            ORDER BY last_joined_at DESC
-        """, (guild_id, minutes), fetch=True)
-    
-    def get_alt_detections(self, guild_id: int, limit: int = 50):
+        return await self.db.execute_named(
+            'get_recent_joins', (guild_id, timedelta(minutes=minutes)), fetch=True
+        )
+    
+    async def get_all_recent_joins(self, minutes: int = 10):
+        """Get recent joins across every guild, oldest first"""
+        return await self.db.execute_named(
+            'get_all_recent_joins', (timedelta(minutes=minutes),), fetch=True
+        )
+    
+    async def get_alt_stats(self, guild_id: int = None, days: int = None):
+        """Detection counts by level and action per guild (optionally only the last `days`)"""
+        conditions = []
+        params = []
+        if guild_id is not None:
+            conditions.append('guild_id = %s')
+            params.append(guild_id)
+        if days:
+            conditions.append("detected_at >= CURRENT_TIMESTAMP - %s * INTERVAL '1 day'")
+            params.append(days)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        return await self.db.execute(f"""
+            SELECT guild_id,
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE suspicion_level = 'CRITICAL') AS critical,
+                   COUNT(*) FILTER (WHERE suspicion_level = 'HIGH') AS high,
+                   COUNT(*) FILTER (WHERE suspicion_level = 'MEDIUM') AS medium,
+                   COUNT(*) FILTER (WHERE suspicion_level = 'LOW') AS low,
+                   COUNT(*) FILTER (WHERE timed_out) AS timed_out,
+                   COUNT(*) FILTER (WHERE kicked) AS kicked
+            FROM alt_detections
+            {where}
+            GROUP BY guild_id
+        """, tuple(params), fetch=True)
+    
+    async def ensure_partitions(self, months_ahead: int = 2):
+        """Create monthly alt_detections partitions up to a few months ahead"""
+        if not self.db.detections_partitioned or not is_primary_process():
+            return
+        
+        now = datetime.utcnow()
+        month = datetime(now.year, now.month, 1)
+        for _ in range(months_ahead + 1):
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            await self.db.execute(f"""
+                CREATE TABLE IF NOT EXISTS alt_detections_p{month:%Y%m}
+                PARTITION OF alt_detections
+                FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')
+            """)
+            month = next_month
+    
+    async def prune_history(self):
+        """Apply retention to alt_detections and user_tracking in small batches"""
+        if not is_primary_process():
+            return
+        
+        result = await self.db.execute("""
+            SELECT guild_id, retention_days FROM guild_settings
+            WHERE retention_days IS NOT NULL
+        """, fetch=True)
+        if result is None:
+            return
+        
+        retention = {row['guild_id']: row['retention_days'] for row in result}
+        removed = 0
+        
+        if self.db.detections_partitioned:
+            await self.ensure_partitions()
+            # A month can only go once every guild's retention has passed it
+            longest = max([Config.DETECTION_RETENTION_DAYS, *retention.values()])
+            await self._drop_old_partitions(longest)
+        
+        for guild_id, days in retention.items():
+            removed += await self._prune_detections('guild_id = %s', (guild_id,), days)
+        removed += await self._prune_detections(
+            'guild_id <> ALL(%s)', (list(retention),), Config.DETECTION_RETENTION_DAYS
+        )
+        
+        tracking_removed = await self._prune_batches("""
+            DELETE FROM user_tracking
+            WHERE (user_id, guild_id) IN (
+                SELECT user_id, guild_id FROM user_tracking
+                WHERE last_joined_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                LIMIT %s
+            )
+        """, (Config.TRACKING_RETENTION_DAYS, Config.PRUNE_BATCH_SIZE))
+        
+        # Write ids only matter while a journaled copy could still be waiting
+        await self._prune_batches("""
+            DELETE FROM applied_writes
+            WHERE write_id IN (
+                SELECT write_id FROM applied_writes
+                WHERE applied_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                LIMIT %s
+            )
+        """, (Config.APPLIED_WRITES_RETENTION_DAYS, Config.PRUNE_BATCH_SIZE))
+        
+        if removed or tracking_removed:
+            logger.info(f'🧹 Pruned {removed} detections and {tracking_removed} tracked users')
+    
+    async def _prune_detections(self, condition: str, params: tuple, days: int) -> int:
+        """Delete (or archive) expired detections matching `condition`"""
+        doomed = f"""
+            DELETE FROM alt_detections
+            WHERE id IN (
+                SELECT id FROM alt_detections
+                WHERE {condition}
+                AND detected_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                LIMIT %s
+            )
+        """
+        if Config.ARCHIVE_DETECTIONS:
+            query = f"""
+                WITH moved AS ({doomed} RETURNING *)
+                INSERT INTO alt_detections_archive SELECT * FROM moved
+            """
+        else:
+            query = doomed
+        return await self._prune_batches(query, (*params, days, Config.PRUNE_BATCH_SIZE))
+    
+    async def _prune_batches(self, query: str, params: tuple) -> int:
+        """Repeat a bounded DELETE until it comes up short, one commit per batch"""
+        def work(cur):
+            cur.execute(query, params)
+            return cur.rowcount
+        
+        total = 0
+        while True:
+            try:
+                count = await self.db.run(work)
+            except Exception as e:
+                logger.error(f'Prune batch failed: {e}')
+                metrics.exceptions.inc('prune')
+                break
+            if not count:
+                break
+            total += count
+            if count < Config.PRUNE_BATCH_SIZE:
+                break
+            await asyncio.sleep(Config.PRUNE_BATCH_PAUSE)
+        return total
+    
+    async def _drop_old_partitions(self, days: int):
+        """Drop (or detach, when archiving) monthly partitions older than `days`"""
+        result = await self.db.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'alt_detections'::regclass
+        """, fetch=True)
+        
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        for row in result or []:
+            match = re.fullmatch(r'alt_detections_p(\d{4})(\d{2})', row['relname'])
+            if not match:
+                continue
+            
+            month_end = (datetime(int(match[1]), int(match[2]), 1) + timedelta(days=32)).replace(day=1)
+            if month_end > cutoff:
+                continue
+            
+            if Config.ARCHIVE_DETECTIONS:
+                # A detached partition stays around as a plain archive table
+                query = f'ALTER TABLE alt_detections DETACH PARTITION {row["relname"]}'
+            else:
+                query = f'DROP TABLE {row["relname"]}'
+            
+            if await self.db.execute(query):
+                logger.info(f'🧹 Retired partition {row["relname"]}')
+    
+    async def get_alt_detections(self, guild_id: int, limit: int = 50):
         """Get alt detections"""
-        return self.db.execute("""
-            SELECT * FROM alt_detections
-            WHERE guild_id = %s
-            ORDER BY detected_at DESC
-            LIMIT %s
-        """, (guild_id, limit), fetch=True)
+        return await self.db.execute_named('get_alt_detections', (guild_id, limit), fetch=True)
+    
+    async def get_scan(self, guild_id: int) -> Optional[dict]:
+        """A guild's member scan checkpoint, if it has one"""
+        result = await self.db.execute_named('get_scan', (guild_id,), fetch=True)
+        return result[0] if result else None
+    
+    async def start_scan(self, guild_id: int, started_by: int, fresh: bool) -> Optional[dict]:
+        """Mark a scan running and return its checkpoint (a fresh scan drops the old one)"""
+        def write(cur):
+            if fresh:
+                cur.execute("DELETE FROM scan_results WHERE guild_id = %s", (guild_id,))
+                cur.execute("DELETE FROM scan_progress WHERE guild_id = %s", (guild_id,))
+            cur.execute("""
+                INSERT INTO scan_progress (guild_id, started_by)
+                VALUES (%s, %s)
+                ON CONFLICT (guild_id) DO UPDATE SET
+                    status = 'running',
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING *
+            """, (guild_id, started_by))
+            return cur.fetchone()
+        
+        try:
+            return await self.db.run(write)
+        except Exception as e:
+            logger.error(f'Failed to start scan: {e}')
+            metrics.exceptions.inc('scan_start')
+            return None
+    
+    async def save_scan_chunk(self, guild_id: int, rows: list, last_user_id: int,
+                              scanned: int, flagged: int) -> bool:
+        """Write a chunk's flagged members and move the checkpoint in one transaction"""
+        def write(cur):
+            if rows:
+                execute_values(cur, """
+                    INSERT INTO scan_results
+                    (guild_id, user_id, username, suspicion_score, suspicion_level,
+                     reasons, similar_to_user_id, similar_to_username)
+                    VALUES %s
+                    ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                        username = EXCLUDED.username,
+                        suspicion_score = EXCLUDED.suspicion_score,
+                        suspicion_level = EXCLUDED.suspicion_level,
+                        reasons = EXCLUDED.reasons,
+                        similar_to_user_id = EXCLUDED.similar_to_user_id,
+                        similar_to_username = EXCLUDED.similar_to_username,
+                        scanned_at = CURRENT_TIMESTAMP
+                """, rows, page_size=len(rows))
+            cur.execute("""
+                UPDATE scan_progress
+                SET last_user_id = %s, scanned = %s, flagged = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE guild_id = %s
+            """, (last_user_id, scanned, flagged, guild_id))
+            return True
+        
+        try:
+            return bool(await self.db.run(write))
+        except Exception as e:
+            logger.error(f'Failed to save scan results: {e}')
+            metrics.exceptions.inc('scan_save')
+            return False
+    
+    async def finish_scan(self, guild_id: int, status: str):
+        await self.db.execute_named('finish_scan', (status, guild_id))
+    
+    async def get_scan_results(self, guild_id: int, limit: int = 10):
+        """A guild's most suspicious scanned members"""
+        return await self.db.execute_named('get_scan_results', (guild_id, limit), fetch=True)
+
+class LoopMonitor:
+    """Measures event loop stalls (how late a timed wakeup actually fires)"""
+    
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._task = None
+    
+    def start(self):
+        """Start sampling in the background"""
+        if not self._task:
+            self._task = asyncio.create_task(self._sample())
+    
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                logger.warning(f'⚠️ Event loop stalled for {lag * 1000:.0f}ms')
+    
+    def snapshot(self) -> dict:
+        """Current lag figures in milliseconds"""
+        return {
+            'loop_lag_ms': round(self.last_lag * 1000, 1),
+            'loop_lag_max_ms': round(self.max_lag * 1000, 1),
+            'loop_stalls': self.stalls
+        }
 
 data_manager = DataManager()
+loop_monitor = LoopMonitor(Config.LOOP_MONITOR_INTERVAL, Config.LOOP_STALL_THRESHOLD)
 
 # ============================================
 # SECTION 3: BOT SETUP & HELPER FUNCTIONS
 # Paste this right after Section 2
 # ============================================
 
-intents = discord.Intents.all()
-bot = commands.Bot(
+def gateway_options(lean: bool) -> dict:
+    """Intents and member cache settings for the bot"""
+    if not lean:
+        intents = discord.Intents.all()
+        return dict(
+            intents=intents,
+            member_cache_flags=discord.MemberCacheFlags.from_intents(intents),
+            chunk_guilds_at_startup=True
+        )
+    
+    # Only what the bot uses: guild/channel events, member joins and prefix commands.
+    # No presences and no member cache; the join tracker keeps its own JoinRecords.
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.members = True
+    intents.guild_messages = True
+    intents.message_content = True
+    return dict(
+        intents=intents,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        chunk_guilds_at_startup=False
+    )
+
+bot_options = dict(
     command_prefix=Config.PREFIX,
-    intents=intents,
+    **gateway_options(Config.LEAN_INTENTS),
     help_command=None,
     case_insensitive=True,
     owner_id=Config.OWNER_ID
 )
 
+if Config.SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        shard_count=Config.SHARD_COUNT,
+        shard_ids=sorted(Config.SHARD_IDS) or None,
+        **bot_options
+    )
+else:
+    bot = commands.Bot(**bot_options)
+
 # Helper Functions
 def is_staff():
     """Check if user is staff or admin"""
@@ -304,33 +1990,138 @@ def is_staff():
         return ctx.author.guild_permissions.administrator
     return commands.check(predicate)
 
+log_channel_locks = defaultdict(asyncio.Lock)  # guild_id: lock around channel creation
+
+def cached_log_channel(guild: discord.Guild) -> Optional[discord.TextChannel]:
+    """Log channel from the id cache, if it still exists"""
+    channel_id = data_manager.log_channels.get(guild.id)
+    if not channel_id:
+        return None
+    channel = guild.get_channel(channel_id)
+    return channel if isinstance(channel, discord.TextChannel) else None
+
 async def get_log_channel(guild: discord.Guild) -> Optional[discord.TextChannel]:
     """Get or create log channel"""
-    channel = discord.utils.get(guild.text_channels, name='security-logs')
+    channel = cached_log_channel(guild)
+    if channel:
+        return channel
     
-    if not channel:
-        try:
-            overwrites = {
-                guild.default_role: discord.PermissionOverwrite(view_channel=False),
-                guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True)
-            }
-            channel = await guild.create_text_channel(
-                'security-logs',
-                overwrites=overwrites,
-                reason='Security log channel'
-            )
-        except:
-            return None
+    # Only one lookup/creation per guild at a time
+    async with log_channel_locks[guild.id]:
+        channel = cached_log_channel(guild)
+        if channel:
+            return channel
+        
+        channel = discord.utils.get(guild.text_channels, name='security-logs')
+        
+        if not channel:
+            try:
+                overwrites = {
+                    guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                    guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True)
+                }
+                channel = await guild.create_text_channel(
+                    'security-logs',
+                    overwrites=overwrites,
+                    reason='Security log channel'
+                )
+            except Exception as e:
+                logger.warning(f'Failed to create a log channel in {guild.id}: {e}')
+                metrics.exceptions.inc('log_channel')
+                return None
+        
+        await data_manager.set_log_channel(guild.id, channel.id)
+        return channel
+
+class LogDispatcher:
+    """Queues security log embeds per guild and sends them in packed, rate-limited batches"""
+    
+    def __init__(self, max_queue: int, rate: int, per: float):
+        self.max_queue = max_queue
+        self.rate = rate
+        self.per = per
+        self.queues = {}  # guild_id: deque of embeds
+        self.workers = {}  # guild_id: drain task
+        self.sends = defaultdict(deque)  # channel_id: recent send times
+        self.stats = {'queued': 0, 'sent': 0, 'messages': 0, 'dropped': 0, 'rate_limited': 0}
+    
+    def send(self, guild: discord.Guild, embed: discord.Embed):
+        """Queue an embed for the guild's log channel"""
+        queue = self.queues.setdefault(guild.id, deque())
+        if len(queue) >= self.max_queue:
+            queue.popleft()
+            self.stats['dropped'] += 1
+        queue.append(embed)
+        self.stats['queued'] += 1
+        
+        if guild.id not in self.workers:
+            self.workers[guild.id] = spawn(self._drain(guild))
+    
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
     
-    return channel
+    def _next_batch(self, queue: deque) -> List[discord.Embed]:
+        """Up to 10 embeds that fit in one message's 6000 character budget"""
+        batch = []
+        size = 0
+        while queue and len(batch) < 10 and size + len(queue[0]) <= 6000:
+            size += len(queue[0])
+            batch.append(queue.popleft())
+        if not batch:
+            batch.append(queue.popleft())  # oversized embed, let Discord reject it
+        return batch
+    
+    async def _wait_for_bucket(self, channel_id: int):
+        """Stay under `rate` messages per `per` seconds for one channel"""
+        sends = self.sends[channel_id]
+        now = time.monotonic()
+        while sends and sends[0] <= now - self.per:
+            sends.popleft()
+        if len(sends) >= self.rate:
+            await asyncio.sleep(sends[0] + self.per - now)
+            sends.popleft()
+        sends.append(time.monotonic())
+    
+    async def _drain(self, guild: discord.Guild):
+        queue = self.queues[guild.id]
+        try:
+            while queue:
+                channel = await get_log_channel(guild)
+                if not channel:
+                    self.stats['dropped'] += len(queue)
+                    queue.clear()
+                    break
+                
+                await self._wait_for_bucket(channel.id)
+                batch = self._next_batch(queue)
+                started = time.perf_counter()
+                try:
+                    await channel.send(embeds=batch)
+                    self.stats['sent'] += len(batch)
+                    self.stats['messages'] += 1
+                except discord.HTTPException as e:
+                    metrics.exceptions.inc('log_send')
+                    if e.status == 429:
+                        # Put the batch back and wait out the bucket
+                        self.stats['rate_limited'] += 1
+                        queue.extendleft(reversed(batch))
+                        await asyncio.sleep(getattr(e, 'retry_after', None) or self.per)
+                    else:
+                        self.stats['dropped'] += len(batch)
+                        logger.warning(f'Failed to send security log in guild {guild.id}: {e}')
+                finally:
+                    metrics.discord_requests.observe(time.perf_counter() - started, 'channel_send')
+        finally:
+            self.workers.pop(guild.id, None)
+            if not queue:
+                self.queues.pop(guild.id, None)
+
+log_dispatcher = LogDispatcher(Config.LOG_QUEUE_MAX, Config.LOG_RATE_LIMIT, Config.LOG_RATE_PERIOD)
 
 async def log_action(guild: discord.Guild, title: str, description: str, 
                     color: int, fields: List[tuple] = None):
-    """Send log message"""
-    channel = await get_log_channel(guild)
-    if not channel:
-        return
-    
+    """Queue a log message"""
     embed = discord.Embed(
         title=title,
         description=description,
@@ -342,10 +2133,7 @@ async def log_action(guild: discord.Guild, title: str, description: str,
         for name, value in fields:
             embed.add_field(name=name, value=value, inline=True)
     
-    try:
-        await channel.send(embed=embed)
-    except:
-        pass
+    log_dispatcher.send(guild, embed)
 
 # Bot Events
 @bot.event
@@ -357,7 +2145,8 @@ async def on_ready():
     print(f'\n📱 Bot: {bot.user.name}')
     print(f'🆔 ID: {bot.user.id}')
     print(f'🏠 Servers: {len(bot.guilds)}')
-    print(f'👥 Users: {len(bot.users)}')
+    # member_count comes with each guild, so this is right without a member cache too
+    print(f'👥 Users: {sum(guild.member_count or 0 for guild in bot.guilds)}')
     print(f'⚙️  Prefix: {Config.PREFIX}')
     print(f'\n💚 Status: READY\n')
     print('='*60 + '\n')
@@ -367,6 +2156,7 @@ async def on_ready():
         logger.info(f'✅ Synced {len(synced)} slash commands')
     except Exception as e:
         logger.error(f'Failed to sync commands: {e}')
+        metrics.exceptions.inc('command_sync')
     
     await bot.change_presence(
         activity=discord.Activity(
@@ -379,14 +2169,33 @@ async def on_ready():
     if not cleanup_task.is_running():
         cleanup_task.start()
 
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    """Load settings for a server added after startup"""
+    await data_manager.settings.refresh(guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    """Forget a deleted log channel"""
+    if data_manager.log_channels.get(channel.guild.id) == channel.id:
+        await data_manager.set_log_channel(channel.guild.id, None)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    """Forget the log channel if it was renamed away from security-logs"""
+    if data_manager.log_channels.get(after.guild.id) == after.id and after.name != 'security-logs':
+        await data_manager.set_log_channel(after.guild.id, None)
+
 @tasks.loop(hours=1)
 async def cleanup_task():
     """Cleanup task runs every hour"""
     try:
         logger.info('Running cleanup...')
-        # Add cleanup logic here if needed
+        await data_manager.prune_history()
+        await data_manager.load_detection_counts()
     except Exception as e:
         logger.error(f'Cleanup failed: {e}')
+        metrics.exceptions.inc('cleanup')
 
 @cleanup_task.before_loop
 async def before_cleanup():
@@ -417,6 +2226,12 @@ async def ping(ctx):
         description=f'Latency: **{latency}ms**',
         color=Config.SUCCESS if latency < 100 else Config.WARNING
     )
+    loop_stats = loop_monitor.snapshot()
+    embed.add_field(
+        name='Event Loop',
+        value=f'Lag: {loop_stats["loop_lag_ms"]}ms (max {loop_stats["loop_lag_max_ms"]}ms)',
+        inline=True
+    )
     await ctx.send(embed=embed)
 
 @bot.command(name='info')
@@ -428,7 +2243,7 @@ async def info(ctx):
         color=Config.INFO
     )
     embed.add_field(name='Servers', value=str(len(bot.guilds)), inline=True)
-    embed.add_field(name='Users', value=str(len(bot.users)), inline=True)
+    embed.add_field(name='Users', value=str(sum(guild.member_count or 0 for guild in bot.guilds)), inline=True)
     embed.add_field(name='Prefix', value=Config.PREFIX, inline=True)
     embed.add_field(
         name='Features',
@@ -442,222 +2257,922 @@ async def info(ctx):
 # Paste this right after Section 3
 # ============================================
 
-class AltDetector:
-    """Detects alt accounts"""
+USERNAME_JUNK = re.compile(r'[^a-z0-9]')
+
+# Fixed token order for the similarity index, roughly rarest first
+SIMILARITY_TOKEN_ORDER = {c: i for i, c in enumerate('qjzxvkwyfbghmp9876543210ducltsnroiae')}
+
+def normalize_username(name: str) -> str:
+    """Lowercase a username and strip everything but letters and digits"""
+    return USERNAME_JUNK.sub('', name.lower())
+
+class JoinRecord:
+    """
+    Compact, picklable snapshot of one join - everything the alt checks read.
     
-    def __init__(self):
-        self.recent_joins = defaultdict(list)  # guild_id: [(member, timestamp)]
+    Holding a discord.Member keeps its User, roles and guild graph alive;
+    this keeps a few scalars instead (the raw name is kept for alert text
+    and the pattern check).
+    """
+    __slots__ = ('id', 'name', 'clean', 'created_at', 'has_avatar', 'joined_at')
     
-    def calculate_username_similarity(self, name1: str, name2: str) -> float:
-        """Calculate how similar two usernames are"""
-        clean1 = re.sub(r'[^a-z0-9]', '', name1.lower())
-        clean2 = re.sub(r'[^a-z0-9]', '', name2.lower())
+    def __init__(self, user_id: int, name: str, created_at: float, has_avatar: bool,
+                 joined_at: float = None):
+        self.id = user_id
+        self.name = name
+        self.clean = normalize_username(name)
+        self.created_at = created_at
+        self.has_avatar = has_avatar
+        self.joined_at = joined_at or time.time()
+    
+    @classmethod
+    def from_member(cls, member: discord.Member, joined_at: float = None) -> 'JoinRecord':
+        return cls(member.id, member.name, member.created_at.timestamp(),
+                   member.avatar is not None, joined_at)
+    
+    def __repr__(self):
+        return f'<JoinRecord id={self.id} name={self.name!r}>'
+
+class SimilarityIndex:
+    """
+    Prefix-filter index over normalised usernames.
+    
+    SequenceMatcher.ratio() is 2*M/T, and the M matched characters are a
+    sub-multiset of both names. So two names can only reach the threshold if
+    their character multisets overlap by enough, and with every name's
+    characters sorted in one fixed order any such pair must share a token
+    in their short prefixes. Only names sharing a prefix token are compared.
+    
+    Nothing is stored per user beyond the postings: the caller keeps the name
+    (JoinRecord.clean) and passes it back to remove(), which recomputes the prefix.
+    """
+    
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.size = 0
+        self.postings = defaultdict(set)  # token: {user_id}
+    
+    def _prefix(self, clean: str) -> list:
+        """Tokens (char, nth occurrence) that any similar name must share one of"""
+        seen = defaultdict(int)
+        tokens = []
+        for char in clean:
+            seen[char] += 1
+            tokens.append((char, seen[char]))
+        tokens.sort(key=lambda t: (SIMILARITY_TOKEN_ORDER.get(t[0], len(SIMILARITY_TOKEN_ORDER)), t))
         
-        if not clean1 or not clean2:
-            return 0.0
+        # Smallest overlap any partner above the threshold could have
+        overlap = math.ceil(self.threshold * len(clean) / (2 - self.threshold) - 1e-9)
+        return tokens[:len(clean) - max(overlap, 1) + 1]
+    
+    def add(self, user_id: int, clean: str):
+        """Index a user (not already indexed; remove() the old name first)"""
+        if not clean:
+            return
+        for token in self._prefix(clean):
+            self.postings[token].add(user_id)
+        self.size += 1
+    
+    def remove(self, user_id: int, clean: str):
+        """Unindex a user, given the name they were added with"""
+        removed = False
+        for token in self._prefix(clean) if clean else ():
+            users = self.postings.get(token)
+            if users and user_id in users:
+                removed = True
+                users.discard(user_id)
+                if not users:
+                    del self.postings[token]
+        self.size -= removed
+    
+    def candidates(self, clean: str, exclude: int = None) -> Set[int]:
+        """Users sharing a prefix token with `clean` (a superset of the similar names)"""
+        if not clean:
+            return set()
         
-        return SequenceMatcher(None, clean1, clean2).ratio()
+        candidates = set()
+        for token in self._prefix(clean):
+            candidates.update(self.postings.get(token, ()))
+        candidates.discard(exclude)
+        return candidates
     
-    def check_account_age(self, member: discord.Member) -> tuple:
-        """Check if account is suspiciously new"""
-        age = (datetime.utcnow() - member.created_at).days
+    def __len__(self):
+        return self.size
+
+class JoinTracker:
+    """Per-guild sliding window of recent joiners, oldest first"""
+    
+    def __init__(self, window_minutes: int, max_per_guild: int):
+        self.window = window_minutes * 60
+        self.max_per_guild = max_per_guild
+        self.guilds = defaultdict(OrderedDict)  # guild_id: {user_id: JoinRecord}
+        self.indexes = {}  # guild_id: SimilarityIndex
+    
+    def add(self, guild_id: int, record: JoinRecord):
+        """Record a join (a rejoin moves the member to the newest slot)"""
+        joins = self.guilds[guild_id]
+        if guild_id not in self.indexes:
+            self.indexes[guild_id] = SimilarityIndex(Config.USERNAME_SIMILARITY)
+        index = self.indexes[guild_id]
         
-        if age < Config.VERY_NEW_ACCOUNT:
-            return True, age, 3  # Very suspicious = 3 points
-        elif age < Config.MIN_ACCOUNT_AGE:
-            return True, age, 1  # Suspicious = 1 point
-        else:
-            return False, age, 0
+        previous = joins.pop(record.id, None)
+        if previous:
+            index.remove(previous.id, previous.clean)
+        joins[record.id] = record
+        index.add(record.id, record.clean)
+        self._evict(guild_id)
     
-    def check_avatar(self, member: discord.Member) -> tuple:
-        """Check if member has custom avatar"""
-        if Config.NO_AVATAR_SUSPICIOUS and member.avatar is None:
-            return True, 1  # No avatar = 1 point
-        return False, 0
+    def backfill(self, guild_id: int, records: List[JoinRecord]):
+        """Add older joins (e.g. from the database) without replacing newer ones, keeping time order"""
+        joins = self.guilds[guild_id]
+        if guild_id not in self.indexes:
+            self.indexes[guild_id] = SimilarityIndex(Config.USERNAME_SIMILARITY)
+        index = self.indexes[guild_id]
+        
+        merged = list(joins.values())
+        for record in records:
+            if record.id not in joins:
+                merged.append(record)
+                index.add(record.id, record.clean)
+        merged.sort(key=lambda record: record.joined_at)
+        self.guilds[guild_id] = OrderedDict((record.id, record) for record in merged)
+        self._evict(guild_id)
     
-    def check_similar_usernames(self, member: discord.Member, recent_members: List) -> tuple:
-        """Check for similar usernames in recent joins"""
-        similar_members = []
+    def candidates(self, guild_id: int, clean: str, exclude: int = None) -> List[JoinRecord]:
+        """Joins in the window that may be similar to `clean`, newest first"""
+        if guild_id not in self.guilds:
+            return []
         
-        for other in recent_members:
-            if other.id == member.id:
-                continue
+        self._evict(guild_id)
+        if guild_id not in self.guilds:
+            return []
+        
+        joins = self.guilds[guild_id]
+        cutoff = time.time() - self.window
+        matches = [
+            joins[user_id] for user_id in self.indexes[guild_id].candidates(clean, exclude)
+            if joins[user_id].joined_at >= cutoff
+        ]
+        matches.sort(key=lambda record: record.joined_at, reverse=True)
+        return matches
+    
+    def _evict(self, guild_id: int):
+        """Drop joins that fell out of the window (or over the size cap)"""
+        joins = self.guilds[guild_id]
+        index = self.indexes.get(guild_id)
+        cutoff = time.time() - self.window
+        
+        while joins:
+            user_id, record = next(iter(joins.items()))
+            if record.joined_at >= cutoff and len(joins) <= self.max_per_guild:
+                break
+            joins.popitem(last=False)
+            if index:
+                index.remove(user_id, record.clean)
+        
+        if not joins:
+            del self.guilds[guild_id]
+            self.indexes.pop(guild_id, None)
+    
+    def __len__(self):
+        return sum(len(joins) for joins in self.guilds.values())
+
+# Reason text per rule, in scoring order
+RULE_REASONS = {
+    'very_new_account': '⚠️ Very new account ({age} days old)',
+    'new_account': '⚠️ New account ({age} days old)',
+    'no_avatar': '⚠️ No custom avatar',
+    'similar_username': '⚠️ Username {similarity}% similar to {similar_username}',
+    'pattern_username': '⚠️ Pattern username detected',
+}
+
+LEVEL_COLORS = {
+    'CRITICAL': Config.DANGER,
+    'HIGH': Config.DANGER,
+    'MEDIUM': Config.WARNING,
+    'LOW': Config.INFO,
+}
+
+class RulePlan:
+    """
+    Alt heuristics compiled once per guild configuration.
+    
+    Rule weights and level thresholds come from Config.RULE_WEIGHTS and
+    Config.LEVEL_THRESHOLDS with the guild's rule_overrides on top; the
+    username patterns are compiled into a single regex. Plans are cached by
+    their overrides, so the same plan is reused for every join.
+    """
+    
+    RULES = tuple(RULE_REASONS)
+    CHECKS = ('account_age', 'avatar', 'similar_username', 'username_pattern', 'combine')
+    VECTOR_MIN_BATCH = 32  # smaller batches aren't worth the numpy round trip
+    _cache = {}
+    
+    def __init__(self, weights: dict, levels: dict, patterns: List[str]):
+        points, threshold = GuildSettings.LIMITS['points'][1], GuildSettings.LIMITS['threshold'][1]
+        # Capped, so scores always fit the int64 arrays of the vectorised path
+        self.weights = tuple(min(weights.get(rule, 0), points) for rule in self.RULES)
+        # Most severe first (Config.LEVEL_THRESHOLDS order), so more points never
+        # grade lower even if stored thresholds are out of order
+        self.levels = [(name.upper(), min(minimum, threshold)) for name, minimum in levels.items()]
+        self.pattern = re.compile('|'.join(f'(?:{p})' for p in patterns)) if patterns else None
+    
+    @classmethod
+    def for_settings(cls, settings: dict) -> 'RulePlan':
+        """The compiled plan for a guild's settings"""
+        overrides = settings.get('rule_overrides') or {}
+        key = tuple(sorted(overrides.items()))
+        plan = cls._cache.get(key)
+        if plan is None:
+            weights = dict(Config.RULE_WEIGHTS)
+            if not Config.NO_AVATAR_SUSPICIOUS:
+                weights['no_avatar'] = 0
+            levels = dict(Config.LEVEL_THRESHOLDS)
+            for name, value in overrides.items():
+                if name in weights:
+                    weights[name] = value
+                elif name in levels:
+                    levels[name] = value
             
-            similarity = self.calculate_username_similarity(member.name, other.name)
+            if len(cls._cache) > 256:
+                cls._cache.clear()
+            plan = cls._cache[key] = cls(weights, levels, Config.PATTERN_USERNAMES)
+        return plan
+    
+    @staticmethod
+    def find_similar(record: JoinRecord, candidates: List[JoinRecord], threshold: float) -> Optional[tuple]:
+        """(record, ratio) for the newest candidate at least `threshold` similar, or None"""
+        for other in candidates:
+            # Same argument order as calculate_username_similarity
+            matcher = SequenceMatcher(None, record.clean, other.clean)
+            if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= threshold:
+                return other, ratio
+        return None
+    
+    def level_for(self, score: int) -> str:
+        for name, minimum in self.levels:
+            if score >= minimum:
+                return name
+        return 'LOW'
+    
+    def _hits(self, ages: list, has_avatar: list, similar: list, patterned: list,
+              min_age: int) -> Tuple[list, list]:
+        """Rule hit rows and scores, one per record (pure Python)"""
+        very_new_age = min(Config.VERY_NEW_ACCOUNT, min_age)
+        hits, scores = [], []
+        for age, avatar, match, pattern in zip(ages, has_avatar, similar, patterned):
+            row = (age < very_new_age, very_new_age <= age < min_age, not avatar, match is not None, pattern)
+            hits.append(row)
+            scores.append(sum(weight for weight, hit in zip(self.weights, row) if hit))
+        return hits, scores
+    
+    def _hits_vectorised(self, ages: list, has_avatar: list, similar: list, patterned: list,
+                         min_age: int) -> Tuple[list, list]:
+        """Rule hit rows and scores, one per record (numpy)"""
+        very_new_age = min(Config.VERY_NEW_ACCOUNT, min_age)
+        age = np.asarray(ages)
+        matrix = np.column_stack([
+            age < very_new_age,
+            (age >= very_new_age) & (age < min_age),
+            ~np.asarray(has_avatar, dtype=bool),
+            np.fromiter((match is not None for match in similar), dtype=bool, count=len(similar)),
+            np.asarray(patterned, dtype=bool),
+        ])
+        scores = matrix.astype(np.int64) @ np.asarray(self.weights, dtype=np.int64)
+        return matrix.tolist(), scores.tolist()
+    
+    def score_batch(self, jobs: List[tuple], min_age: int, now: float,
+                    threshold: float = None, timings: dict = None) -> List[dict]:
+        """Score [(record, candidates)] at once, one result dict per record
+        
+        If `timings` is given, the seconds spent in each check are added to it.
+        """
+        threshold = threshold or Config.USERNAME_SIMILARITY
+        records = [record for record, _ in jobs]
+        marks = [time.perf_counter()]
+        
+        # Similarity and patterns are per-name work; everything else is column arithmetic
+        ages = [int((now - record.created_at) // 86400) for record in records]
+        marks.append(time.perf_counter())
+        has_avatar = [record.has_avatar for record in records]
+        marks.append(time.perf_counter())
+        similar = [self.find_similar(record, candidates, threshold) for record, candidates in jobs]
+        marks.append(time.perf_counter())
+        patterned = [bool(self.pattern and self.pattern.match(record.name)) for record in records]
+        marks.append(time.perf_counter())
+        
+        if np is not None and len(jobs) >= self.VECTOR_MIN_BATCH:
+            hits, scores = self._hits_vectorised(ages, has_avatar, similar, patterned, min_age)
+        else:
+            hits, scores = self._hits(ages, has_avatar, similar, patterned, min_age)
+        marks.append(time.perf_counter())
+        
+        if timings is not None:
+            for check, start, end in zip(self.CHECKS, marks, marks[1:]):
+                timings[check] = timings.get(check, 0.0) + end - start
+        
+        results = []
+        for age, match, row, score in zip(ages, similar, hits, scores):
+            details = {'age': age}
+            if match:
+                details['similarity'] = int(match[1] * 100)
+                details['similar_username'] = match[0].name
             
-            if similarity >= Config.USERNAME_SIMILARITY:
-                similar_members.append((other, similarity))
+            # A rule weighted 0 for this guild doesn't count as a reason either
+            breakdown = [
+                (RULE_REASONS[rule].format(**details), weight)
+                for rule, weight, hit in zip(self.RULES, self.weights, row) if hit and weight
+            ]
+            level = self.level_for(score)
+            results.append({
+                'score': score,
+                'level': level,
+                'color': LEVEL_COLORS[level],
+                'reasons': [reason for reason, _ in breakdown],
+                'breakdown': breakdown,
+                'similar_to': match[0].id if match else None,
+                'similar_username': match[0].name if match else None
+            })
+        return results
+
+def score_jobs(jobs: List[tuple], settings: dict, now: float) -> Tuple[List[dict], dict]:
+    """Score [(record, candidates)] in a scoring pool worker; (results, seconds per check)"""
+    timings = {}
+    results = RulePlan.for_settings(settings).score_batch(
+        jobs, settings['min_account_age'], now, timings=timings
+    )
+    return results, timings
+
+class ScoringPool:
+    """Runs alt scoring in a thread or process pool with bounded concurrency"""
+    
+    def __init__(self, kind: str, workers: int, max_inflight: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_inflight = max_inflight
+        self.executor = None
+        self.semaphore = None
+        self.waiting = 0
+        self.stats = {'jobs': 0, 'members': 0, 'total_ms': 0.0}
+    
+    def _start(self):
+        if self.kind == 'process':
+            # spawn, not fork: forking a process with a running event loop and threads is unsafe
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='scoring')
+        self.semaphore = asyncio.Semaphore(self.max_inflight)
+        logger.info(f'✅ Scoring pool started ({self.workers} {self.kind} workers)')
+    
+    async def score(self, jobs: List[tuple], settings: dict) -> List[dict]:
+        """Score jobs off the loop; callers wait here while the pool is saturated"""
+        if not jobs:
+            return []
+        if self.executor is None:
+            self._start()
+        
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        
+        try:
+            start = time.perf_counter()
+            results, timings = await asyncio.get_running_loop().run_in_executor(
+                self.executor, score_jobs, jobs, dict(settings), time.time()
+            )
+            elapsed = time.perf_counter() - start
+            self.stats['jobs'] += 1
+            self.stats['members'] += len(jobs)
+            self.stats['total_ms'] += elapsed * 1000
+            metrics.scoring.observe(elapsed)
+            for check, seconds in timings.items():
+                metrics.checks.observe(seconds, check)
+            return results
+        finally:
+            self.semaphore.release()
+    
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+class AltDetector:
+    """Detects alt accounts"""
+    
+    def __init__(self):
+        self.recent_joins = JoinTracker(Config.RECENT_JOIN_WINDOW, Config.RECENT_JOIN_MAX)
+        self.recent_joins_loaded = False
+    
+    async def rebuild_recent_joins(self):
+        """Refill the join window from user_tracking after a restart"""
+        if self.recent_joins_loaded:
+            return
+        
+        rows = await data_manager.get_all_recent_joins(Config.RECENT_JOIN_WINDOW)
+        if rows is None:
+            return
+        
+        # Rebuilt from the stored join rows, so this works without a member cache
+        now = time.time()
+        restored = defaultdict(list)
+        for row in rows:
+            if not owns_guild(row['guild_id']) or row['created_at'] is None:
+                continue
+            restored[row['guild_id']].append(JoinRecord(
+                row['user_id'], row['username'], float(row['created_at']),
+                row['has_avatar'], now - float(row['age_seconds'])
+            ))
+        # Joins seen live since startup stay as they are
+        for guild_id, records in restored.items():
+            self.recent_joins.backfill(guild_id, records)
         
-        if similar_members:
-            return True, similar_members, 2  # Similar username = 2 points
-        return False, [], 0
+        self.recent_joins_loaded = True
+        logger.info(f'✅ Rebuilt join window ({len(self.recent_joins)} recent joins)')
+    
+    @staticmethod
+    def calculate_username_similarity(name1: str, name2: str) -> float:
+        """Calculate how similar two usernames are"""
+        clean1 = normalize_username(name1)
+        clean2 = normalize_username(name2)
+        
+        if not clean1 or not clean2:
+            return 0.0
+        
+        return SequenceMatcher(None, clean1, clean2).ratio()
+    
+    def should_skip(self, member: discord.Member, guild: discord.Guild) -> bool:
+        """Whitelisted users, the bot owner and bots are never checked"""
+        if data_manager.is_whitelisted(guild.id, member.id) or member.id == Config.OWNER_ID:
+            return True
+        return member.bot
     
-    def check_pattern_username(self, username: str) -> tuple:
-        """Check for pattern usernames like User1, User2, etc"""
-        # Pattern: word + number
-        pattern = r'^([a-zA-Z]+)(\d+)$'
-        match = re.match(pattern, username)
-        
-        if match:
-            return True, 1  # Pattern username = 1 point
-        return False, 0
+    async def score_records(self, records: List[JoinRecord], guild_id: int,
+                            settings: dict = None) -> List[dict]:
+        """Score join records in the scoring pool, one result per record"""
+        settings = settings or data_manager.settings.get(guild_id)
+        # Candidate lookup is cheap set work on the loop; verifying them is the pool's job
+        jobs = [
+            (record, self.recent_joins.candidates(guild_id, record.clean, exclude=record.id))
+            for record in records
+        ]
+        return await scoring_pool.score(jobs, settings)
+    
+    async def score_member(self, member: discord.Member, guild_id: int, settings: dict = None) -> dict:
+        """Score a member in memory: no join tracking, no DB writes, no actions"""
+        results = await self.score_records([JoinRecord.from_member(member)], guild_id, settings)
+        return results[0]
     
     async def detect_alt(self, member: discord.Member, guild: discord.Guild):
         """Main alt detection function"""
         
-        # Skip if whitelisted or bot owner
-        if data_manager.is_whitelisted(guild.id, member.id) or member.id == Config.OWNER_ID:
+        # Skip if whitelisted, bot owner or a bot
+        if self.should_skip(member, guild):
             return
         
-        # Skip bots
-        if member.bot:
+        settings = data_manager.settings.get(guild.id)
+        if not settings['alt_detection_enabled']:
             return
         
-        # Track this join
-        data_manager.track_user_join(guild.id, member)
-        
-        # Get recent joins
-        recent_data = data_manager.get_recent_joins(guild.id, 10)
-        recent_members = []
-        
-        for data in recent_data or []:
-            m = guild.get_member(data['user_id'])
-            if m and m.id != member.id:
-                recent_members.append(m)
+        # Track this join (in memory now, Postgres on the next bulk flush)
+        record = JoinRecord.from_member(member)
+        self.recent_joins.add(guild.id, record)
+        await data_manager.track_user_join(guild.id, member)
         
         # Calculate suspicion score
-        suspicion_score = 0
-        reasons = []
-        similar_to = None
-        similar_username = None
-        
-        # Check 1: Account age
-        is_new, age_days, age_points = self.check_account_age(member)
-        if is_new:
-            suspicion_score += age_points
-            if age_points == 3:
-                reasons.append(f"⚠️ Very new account ({age_days} days old)")
-            else:
-                reasons.append(f"⚠️ New account ({age_days} days old)")
-        
-        # Check 2: Avatar
-        no_avatar, avatar_points = self.check_avatar(member)
-        if no_avatar:
-            suspicion_score += avatar_points
-            reasons.append("⚠️ No custom avatar")
-        
-        # Check 3: Similar usernames
-        has_similar, similar_list, similar_points = self.check_similar_usernames(member, recent_members)
-        if has_similar:
-            suspicion_score += similar_points
-            similar_to = similar_list[0][0].id
-            similar_username = similar_list[0][0].name
-            similarity_pct = int(similar_list[0][1] * 100)
-            reasons.append(f"⚠️ Username {similarity_pct}% similar to {similar_list[0][0].name}")
-        
-        # Check 4: Pattern username
-        is_pattern, pattern_points = self.check_pattern_username(member.name)
-        if is_pattern:
-            suspicion_score += pattern_points
-            reasons.append("⚠️ Pattern username detected")
-        
-        # Determine suspicion level
-        if suspicion_score >= 6:
-            level = 'CRITICAL'
-            color = Config.DANGER
-        elif suspicion_score >= 4:
-            level = 'HIGH'
-            color = Config.DANGER
-        elif suspicion_score >= 2:
-            level = 'MEDIUM'
-            color = Config.WARNING
-        else:
-            level = 'LOW'
-            color = Config.INFO
+        [result] = await self.score_records([record], guild.id, settings)
         
-        # Only alert if score is high enough
-        if suspicion_score < 2:
+        # Only alert from MEDIUM up (the guild's thresholds decide the level)
+        if result['level'] == 'LOW':
             return
         
+        await self.act_on_result(member, guild, result, settings)
+    
+    async def act_on_result(self, member: discord.Member, guild: discord.Guild, result: dict,
+                            settings: dict) -> str:
+        """Time out (if configured), save and log a flagged member; returns the action taken"""
+        suspicion_score = result['score']
+        level = result['level']
+        
         # Take action based on level
         action_taken = 'none'
         
-        if suspicion_score >= 6 and Config.AUTO_TIMEOUT_ALTS:
+        if level == 'CRITICAL' and settings['auto_timeout_alts']:
+            started = time.perf_counter()
             try:
                 await member.timeout(
-                    timedelta(minutes=Config.TIMEOUT_DURATION),
+                    timedelta(minutes=settings['timeout_duration']),
                     reason=f'Alt detection: {level} suspicion ({suspicion_score} points)'
                 )
                 action_taken = 'timeout'
-            except:
-                pass
+            except discord.HTTPException as e:
+                logger.warning(f'Timeout failed for {member.id}: {e}')
+                metrics.exceptions.inc('member_timeout')
+            metrics.discord_requests.observe(time.perf_counter() - started, 'member_timeout')
         
         # Save to database
-        data_manager.save_alt_detection(
+        await data_manager.save_alt_detection(
             guild.id, member.id, member.name,
-            suspicion_score, level, reasons,
-            similar_to, similar_username, action_taken
+            suspicion_score, level, result['reasons'],
+            result['similar_to'], result['similar_username'], action_taken
         )
         
-        # Send alert
+        # Send alert (the detailed embed already carries the score)
+        log_dispatcher.send(guild, self.build_alert_embed(member, result, action_taken, settings))
+        return action_taken
+    
+    def build_alert_embed(self, member: discord.Member, result: dict, action_taken: str,
+                          settings: dict) -> discord.Embed:
+        """Detailed alert embed for one flagged member"""
         embed = discord.Embed(
-            title=f'🚨 Alt Account Detected - {level}',
-            description=f'{member.mention} joined with suspicion level **{level}**',
-            color=color,
+            title=f'🚨 Alt Account Detected - {result["level"]}',
+            description=f'{member.mention} joined with suspicion level **{result["level"]}**',
+            color=result['color'],
             timestamp=datetime.utcnow()
         )
         
         embed.add_field(name='User', value=f'{member.name}#{member.discriminator}', inline=True)
         embed.add_field(name='ID', value=str(member.id), inline=True)
-        embed.add_field(name='Score', value=f'{suspicion_score} points', inline=True)
+        embed.add_field(name='Score', value=f'{result["score"]} points', inline=True)
         
         embed.add_field(
             name='Reasons',
-            value='\n'.join(reasons) if reasons else 'None',
+            value='\n'.join(result['reasons']) if result['reasons'] else 'None',
             inline=False
         )
         
-        if similar_to:
+        if result['similar_to']:
             embed.add_field(
                 name='Similar To',
-                value=f'{similar_username} (ID: {similar_to})',
+                value=f'{result["similar_username"]} (ID: {result["similar_to"]})',
                 inline=False
             )
         
         if action_taken != 'none':
             embed.add_field(
                 name='Action Taken',
-                value=f'✅ User was timed out for {Config.TIMEOUT_DURATION} minutes',
+                value=f'✅ User was timed out for {settings["timeout_duration"]} minutes',
                 inline=False
             )
         
         embed.set_thumbnail(url=member.display_avatar.url)
         embed.set_footer(text=f'Account created')
         embed.timestamp = member.created_at
+        return embed
+    
+    async def process_raid_batch(self, guild: discord.Guild, members: List[discord.Member]):
+        """Score a batch of raid joiners together and act on them in bulk"""
+        settings = data_manager.settings.get(guild.id)
+        if not settings['alt_detection_enabled']:
+            return
+        
+        members = [m for m in members if not self.should_skip(m, guild)]
+        if not members:
+            return
+        
+        # Put the whole batch in the window first so joiners match each other
+        records = [JoinRecord.from_member(member) for member in members]
+        for record in records:
+            self.recent_joins.add(guild.id, record)
+        
+        # One trip to the scoring pool for the whole batch
+        results = await self.score_records(records, guild.id, settings)
+        
+        detections = []
+        level_counts = defaultdict(int)
+        for member, result in zip(members, results):
+            if result['level'] == 'LOW':
+                continue
+            
+            # Recorded as queued; the ActionWorker settles it once the timeout is tried
+            action_taken = 'none'
+            if result['level'] == 'CRITICAL' and settings['auto_timeout_alts']:
+                action_taken = 'timeout_queued'
+            
+            detections.append((member, result, action_taken))
+            level_counts[result['level']] += 1
+        
+        # One transaction for the whole batch
+        await data_manager.save_join_batch(guild.id, members, detections)
+        
+        # Queued after the batch is saved, so its outcome is written after the detection
+        timed_out = 0
+        for member, result, action_taken in detections:
+            if action_taken == 'timeout_queued':
+                action_worker.submit(
+                    member,
+                    timedelta(minutes=settings['timeout_duration']),
+                    f'Alt detection (raid): {result["level"]} suspicion ({result["score"]} points)'
+                )
+                timed_out += 1
+        flagged = ', '.join(m.mention for m, _, _ in detections[:20]) or 'None'
+        if len(detections) > 20:
+            flagged += f' (+{len(detections) - 20} more)'
         
         await log_action(
             guild,
-            f'Alt Detection - {level}',
-            f'{member.mention} flagged as potential alt',
-            color,
-            [('Suspicion Score', f'{suspicion_score} points')]
+            '🚨 Raid Batch Processed',
+            f'**{len(members)}** joins scored together while raid mode is active',
+            Config.DANGER,
+            [
+                ('Flagged', str(len(detections))),
+                ('Critical', str(level_counts['CRITICAL'])),
+                ('High', str(level_counts['HIGH'])),
+                ('Medium', str(level_counts['MEDIUM'])),
+                ('Timeouts Queued', str(timed_out)),
+                ('Flagged Members', flagged[:1024])
+            ]
         )
+
+class RaidDetector:
+    """Switches a guild into batched raid mode when the join rate spikes"""
+    
+    def __init__(self, threshold: int, window: int):
+        self.threshold = threshold
+        self.window = window
+        self.join_times = defaultdict(deque)  # guild_id: deque of join timestamps
+        self.raid_until = {}  # guild_id: when raid mode ends
+        self.queues = defaultdict(list)  # guild_id: [member]
+        self.flushers = {}  # guild_id: batch task
+    
+    def record_join(self, guild_id: int) -> bool:
+        """Count a join and return whether the guild is in raid mode"""
+        now = time.monotonic()
+        times = self.join_times[guild_id]
+        times.append(now)
+        while times and times[0] < now - self.window:
+            times.popleft()
+        
+        if len(times) >= self.threshold:
+            if not self.in_raid(guild_id):
+                logger.warning(f'🚨 Raid detected in guild {guild_id}: {len(times)} joins in {self.window}s')
+            # Stay in raid mode until the join rate has been low for a full window
+            self.raid_until[guild_id] = now + self.window
+        
+        return self.in_raid(guild_id)
+    
+    def in_raid(self, guild_id: int) -> bool:
+        return self.raid_until.get(guild_id, 0) > time.monotonic()
+    
+    def enqueue(self, member: discord.Member):
+        """Queue a raid joiner for the next batch"""
+        guild_id = member.guild.id
+        self.queues[guild_id].append(member)
+        if guild_id not in self.flushers:
+            self.flushers[guild_id] = spawn(self._run_batches(member.guild))
+    
+    async def _run_batches(self, guild: discord.Guild):
+        """Flush the guild's queue every RAID_BATCH_INTERVAL until the raid ends"""
+        try:
+            while True:
+                await asyncio.sleep(Config.RAID_BATCH_INTERVAL)
+                batch = self.queues.pop(guild.id, [])
+                if batch:
+                    try:
+                        await alt_detector.process_raid_batch(guild, batch)
+                    except Exception as e:
+                        logger.error(f'Raid batch failed: {e}')
+                        metrics.exceptions.inc('raid_batch')
+                elif not self.in_raid(guild.id):
+                    logger.info(f'✅ Raid mode ended in guild {guild.id}')
+                    break
+        finally:
+            self.flushers.pop(guild.id, None)
+
+class ActionWorker:
+    """Applies moderation timeouts one at a time at a bounded rate"""
+    
+    def __init__(self, per_second: float):
+        self.delay = 1 / per_second
+        self.queue = None
+        self._task = None
+    
+    def submit(self, member: discord.Member, duration: timedelta, reason: str):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.queue.put_nowait((member, duration, reason))
+        if not self._task:
+            self._task = spawn(self._run())
+    
+    async def _run(self):
+        while True:
+            member, duration, reason = await self.queue.get()
+            started = time.perf_counter()
+            applied = False
+            try:
+                await member.timeout(duration, reason=reason)
+                applied = True
+            except discord.HTTPException as e:
+                logger.warning(f'Timeout failed for {member.id}: {e}')
+                metrics.exceptions.inc('member_timeout')
+            metrics.discord_requests.observe(time.perf_counter() - started, 'member_timeout')
+            await data_manager.record_queued_timeout(member.guild.id, member.id, applied)
+            await asyncio.sleep(self.delay)
+
+class JoinSlotIndex:
+    """
+    Members bucketed by join time, one SimilarityIndex per join-window slot.
+    
+    Anyone within the window of a join is in its own slot or a neighbouring
+    one, so a lookup searches three slots however many members are indexed.
+    """
+    
+    def __init__(self, window: float):
+        self.window = window
+        self.slots = {}  # slot number: (SimilarityIndex, {user_id: JoinRecord})
+    
+    def add(self, record: JoinRecord):
+        slot = self.slots.get(record.joined_at // self.window)
+        if slot is None:
+            slot = self.slots[record.joined_at // self.window] = (
+                SimilarityIndex(Config.USERNAME_SIMILARITY), {}
+            )
+        index, records = slot
+        previous = records.pop(record.id, None)
+        if previous:
+            index.remove(previous.id, previous.clean)
+        records[record.id] = record
+        index.add(record.id, record.clean)
+    
+    def candidates(self, record: JoinRecord) -> List[JoinRecord]:
+        """Members joined within the window of `record` that may be similar, closest first"""
+        number = record.joined_at // self.window
+        matches = []
+        for slot in (self.slots.get(number - 1), self.slots.get(number), self.slots.get(number + 1)):
+            if slot is None:
+                continue
+            index, records = slot
+            for user_id in index.candidates(record.clean, record.id):
+                other = records[user_id]
+                if abs(other.joined_at - record.joined_at) <= self.window:
+                    matches.append(other)
+        matches.sort(key=lambda other: abs(other.joined_at - record.joined_at))
+        return matches
+
+class GuildScanner:
+    """
+    Streams a guild's existing members through the scoring pool (!scanserver).
+    
+    Members are fetched in user id order, so the checkpoint is just the last
+    id written. Each member is compared (through a scan-local index bucketed
+    by join time) with the members already scanned who joined within the join
+    window of them. The join tracker and user_tracking are never touched.
+    """
+    
+    YIELD_EVERY = 100  # members indexed between yields to the event loop
+    
+    def __init__(self):
+        self.scans = {}  # guild_id: scan task
+    
+    def running(self, guild_id: int) -> bool:
+        return guild_id in self.scans
+    
+    def start(self, ctx: commands.Context, fresh: bool):
+        self.scans[ctx.guild.id] = spawn(self._run(ctx, fresh))
+    
+    def cancel(self, guild_id: int) -> bool:
+        task = self.scans.get(guild_id)
+        if not task:
+            return False
+        task.cancel()
+        return True
+    
+    @staticmethod
+    def progress_embed(guild: discord.Guild, status: str, scanned: int, flagged: int,
+                       color: int = Config.INFO) -> discord.Embed:
+        total = guild.member_count or 0
+        percent = f' ({min(100, scanned * 100 // total)}%)' if total else ''
+        embed = discord.Embed(title=f'🔎 Server Scan - {status}', color=color)
+        embed.add_field(name='Scanned', value=f'{scanned:,} / {total:,}{percent}', inline=True)
+        embed.add_field(name='Flagged', value=f'{flagged:,}', inline=True)
+        return embed
+    
+    async def _run(self, ctx: commands.Context, fresh: bool):
+        guild = ctx.guild
+        message = None
+        scanned = flagged = 0
+        try:
+            progress = await data_manager.start_scan(guild.id, ctx.author.id, fresh)
+            if progress is None:
+                await ctx.send('❌ Could not start the scan (database unavailable)!')
+                return
+            
+            scanned, flagged = progress['scanned'], progress['flagged']
+            status = 'Resuming' if scanned else 'Running'
+            message = await ctx.send(embed=self.progress_embed(guild, status, scanned, flagged))
+            
+            index = JoinSlotIndex(Config.RECENT_JOIN_WINDOW * 60)  # everything scanned this run
+            last_edit = time.monotonic()
+            chunk = []
+            
+            members = guild.fetch_members(limit=None, after=discord.Object(id=progress['last_user_id']))
+            async for member in members:
+                chunk.append(member)
+                if len(chunk) < Config.SCAN_CHUNK_SIZE:
+                    continue
+                
+                scanned, flagged = await self._scan_chunk(guild, chunk, index, scanned, flagged)
+                chunk = []
+                if time.monotonic() - last_edit >= Config.SCAN_PROGRESS_INTERVAL:
+                    await message.edit(embed=self.progress_embed(guild, 'Running', scanned, flagged))
+                    last_edit = time.monotonic()
+            
+            if chunk:
+                scanned, flagged = await self._scan_chunk(guild, chunk, index, scanned, flagged)
+            
+            await data_manager.finish_scan(guild.id, 'done')
+            embed = self.progress_embed(guild, 'Complete', scanned, flagged, Config.SUCCESS)
+            
+            results = await data_manager.get_scan_results(guild.id, 10)
+            if results:
+                embed.add_field(
+                    name='Most Suspicious',
+                    value='\n'.join(
+                        f'<@{row["user_id"]}> - **{row["suspicion_level"]}** ({row["suspicion_score"]} points)'
+                        for row in results
+                    ),
+                    inline=False
+                )
+            await message.edit(embed=embed)
+            logger.info(f'✅ Scan of guild {guild.id} done: {scanned} scanned, {flagged} flagged')
+        
+        except asyncio.CancelledError:
+            await data_manager.finish_scan(guild.id, 'cancelled')
+            if message:
+                embed = self.progress_embed(guild, 'Cancelled', scanned, flagged, Config.WARNING)
+                embed.set_footer(text=f'Run {Config.PREFIX}scanserver to resume')
+                await message.edit(embed=embed)
+            raise
+        except Exception as e:
+            logger.error(f'Server scan failed: {e}')
+            metrics.exceptions.inc('server_scan')
+            await data_manager.finish_scan(guild.id, 'failed')
+            await ctx.send(f'❌ Scan stopped: {e}. Run `{Config.PREFIX}scanserver` to resume.')
+        finally:
+            self.scans.pop(guild.id, None)
+    
+    async def _scan_chunk(self, guild: discord.Guild, members: List[discord.Member],
+                          index: JoinSlotIndex, scanned: int,
+                          flagged: int) -> Tuple[int, int]:
+        """Score one chunk and checkpoint it; returns the new (scanned, flagged) totals"""
+        settings = data_manager.settings.get(guild.id)
+        
+        jobs = []
+        for position, member in enumerate(members, 1):
+            if position % self.YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+            if alt_detector.should_skip(member, guild):
+                continue
+            joined_at = member.joined_at.timestamp() if member.joined_at else time.time()
+            record = JoinRecord.from_member(member, joined_at)
+            
+            # Only members from neighbouring join slots are looked up, never all pairs
+            jobs.append((record, index.candidates(record)))
+            index.add(record)
         
-        # Send detailed embed
-        log_channel = await get_log_channel(guild)
-        if log_channel:
-            await log_channel.send(embed=embed)
+        rows = []
+        for start in range(0, len(jobs), Config.SCAN_SCORE_BATCH):
+            batch = jobs[start:start + Config.SCAN_SCORE_BATCH]
+            results = await scoring_pool.score(batch, settings)
+            for (record, _), result in zip(batch, results):
+                if result['level'] != 'LOW':
+                    rows.append((
+                        guild.id, record.id, record.name, result['score'], result['level'],
+                        result['reasons'], result['similar_to'], result['similar_username']
+                    ))
+        
+        scanned += len(members)
+        flagged += len(rows)
+        if not await data_manager.save_scan_chunk(guild.id, rows, members[-1].id, scanned, flagged):
+            raise RuntimeError('could not save scan progress')
+        return scanned, flagged
 
+scoring_pool = ScoringPool(Config.SCORING_EXECUTOR, Config.SCORING_WORKERS, Config.SCORING_MAX_INFLIGHT)
 alt_detector = AltDetector()
+guild_scanner = GuildScanner()
+raid_detector = RaidDetector(Config.RAID_JOIN_THRESHOLD, Config.RAID_JOIN_WINDOW)
+action_worker = ActionWorker(Config.RAID_ACTION_RATE)
 
 # Member join event
 @bot.event
 async def on_member_join(member: discord.Member):
     """Called when someone joins the server"""
     try:
-        await alt_detector.detect_alt(member, member.guild)
+        if raid_detector.record_join(member.guild.id):
+            raid_detector.enqueue(member)
+        else:
+            started = time.perf_counter()
+            await alt_detector.detect_alt(member, member.guild)
+            metrics.detect_alt.observe(time.perf_counter() - started)
     except Exception as e:
         logger.error(f'Alt detection failed: {e}')
+        metrics.exceptions.inc('on_member_join')
 
 # ============================================
 # SECTION 5: COMMANDS + HELP MENU
@@ -669,7 +3184,8 @@ async def on_member_join(member: discord.Member):
 @is_staff()
 async def whitelist_add(ctx, member: discord.Member, *, reason: str = 'No reason provided'):
     """Add someone to whitelist (bypasses all checks)"""
-    data_manager.add_to_whitelist(ctx.guild.id, member.id, ctx.author.id, reason)
+    if not await data_manager.add_to_whitelist(ctx.guild.id, member.id, ctx.author.id, reason):
+        return await ctx.send('❌ Could not save the whitelist change, please try again later!')
     
     embed = discord.Embed(
         title='✅ User Whitelisted',
@@ -696,7 +3212,8 @@ async def whitelist_remove(ctx, member: discord.Member):
     if not data_manager.is_whitelisted(ctx.guild.id, member.id):
         return await ctx.send('❌ That user is not whitelisted!')
     
-    data_manager.remove_from_whitelist(ctx.guild.id, member.id)
+    if not await data_manager.remove_from_whitelist(ctx.guild.id, member.id):
+        return await ctx.send('❌ Could not save the whitelist change, please try again later!')
     
     embed = discord.Embed(
         title='❌ User Removed from Whitelist',
@@ -706,16 +3223,167 @@ async def whitelist_remove(ctx, member: discord.Member):
     
     await ctx.send(embed=embed)
 
+async def run_alt_check(guild: discord.Guild, member: discord.Member, apply: bool = False) -> discord.Embed:
+    """Score a member and describe the result; only `apply` saves it or acts on it"""
+    settings = data_manager.settings.get(guild.id)
+    result = await alt_detector.score_member(member, guild.id, settings)
+    
+    embed = discord.Embed(
+        title=f'🔍 Alt Check - {result["level"]}',
+        description=f'{member.mention} scores **{result["score"]} points**',
+        color=result['color']
+    )
+    embed.add_field(
+        name='Breakdown',
+        value='\n'.join(f'+{points} {reason}' for reason, points in result['breakdown']) or 'No signals',
+        inline=False
+    )
+    if result['similar_to']:
+        embed.add_field(
+            name='Similar To',
+            value=f'{result["similar_username"]} (ID: {result["similar_to"]})',
+            inline=False
+        )
+    
+    skipped = alt_detector.should_skip(member, guild)
+    if skipped:
+        embed.add_field(name='Note', value='Whitelisted, owner or bot - never flagged automatically', inline=False)
+    
+    if not apply:
+        embed.set_footer(text='Dry run - nothing was saved. Add "apply" to save and act on it')
+    elif skipped or result['level'] == 'LOW':
+        embed.set_footer(text='Nothing to apply')
+    else:
+        action_taken = await alt_detector.act_on_result(member, guild, result, settings)
+        embed.set_footer(text=f'Saved to history - action: {action_taken}')
+    
+    return embed
+
 @bot.command(name='checkalt')
 @is_staff()
-async def check_alt(ctx, member: discord.Member):
-    """Manually check if someone is an alt"""
-    await ctx.send(f'🔍 Checking {member.mention}...')
+async def check_alt(ctx, member: discord.Member, action: str = None):
+    """Score someone for alt signals (read-only unless `apply`)"""
+    if action and action.lower() != 'apply':
+        return await ctx.send(f'❌ Usage: `{Config.PREFIX}checkalt @user [apply]`')
+    
+    await ctx.send(embed=await run_alt_check(ctx.guild, member, apply=bool(action)))
+
+@bot.command(name='scanserver')
+@is_staff()
+async def scan_server(ctx, action: str = None):
+    """Score every existing member: [cancel|restart]"""
+    action = (action or '').lower()
+    
+    if action == 'cancel':
+        if guild_scanner.cancel(ctx.guild.id):
+            return await ctx.send('⏹️ Cancelling scan...')
+        return await ctx.send('❌ No scan is running!')
+    
+    if action not in ('', 'restart'):
+        return await ctx.send(f'❌ Usage: `{Config.PREFIX}scanserver [cancel|restart]`')
+    
+    if guild_scanner.running(ctx.guild.id):
+        return await ctx.send(f'❌ A scan is already running! Stop it with `{Config.PREFIX}scanserver cancel`')
+    
+    # Pick up an unfinished scan where it stopped, unless asked to start over
+    progress = await data_manager.get_scan(ctx.guild.id)
+    fresh = action == 'restart' or not progress or progress['status'] == 'done'
+    guild_scanner.start(ctx, fresh)
+
+@bot.command(name='altconfig')
+@is_staff()
+async def alt_config(ctx, setting: str = None, value: str = None):
+    """View or change this server's alt detection settings"""
+    settings = data_manager.settings.get(ctx.guild.id)
+    
+    if setting is None:
+        embed = discord.Embed(
+            title='⚙️ Alt Detection Settings',
+            description=f'Change with `{Config.PREFIX}altconfig <setting> <value>`',
+            color=Config.INFO
+        )
+        embed.add_field(name='enabled', value=str(settings['alt_detection_enabled']), inline=True)
+        embed.add_field(name='autotimeout', value=str(settings['auto_timeout_alts']), inline=True)
+        embed.add_field(name='timeout', value=f'{settings["timeout_duration"]} minutes', inline=True)
+        embed.add_field(name='minage', value=f'{settings["min_account_age"]} days', inline=True)
+        embed.add_field(
+            name='retention',
+            value=f'{settings["retention_days"] or Config.DETECTION_RETENTION_DAYS} days',
+            inline=True
+        )
+        
+        overrides = settings['rule_overrides']
+        embed.add_field(
+            name='Rule Points',
+            value='\n'.join(
+                f'`{rule}`: {overrides.get(rule, points)}' for rule, points in Config.RULE_WEIGHTS.items()
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name='Level Thresholds',
+            value='\n'.join(
+                f'`{level}`: {overrides.get(level, minimum)}+ points'
+                for level, minimum in Config.LEVEL_THRESHOLDS.items()
+            ),
+            inline=False
+        )
+        return await ctx.send(embed=embed)
+    
+    setting = setting.lower()
+    if setting in Config.RULE_WEIGHTS or setting in Config.LEVEL_THRESHOLDS:
+        low, high = GuildSettings.LIMITS['points' if setting in Config.RULE_WEIGHTS else 'threshold']
+        if value is None or not value.isdigit() or not low <= int(value) <= high:
+            return await ctx.send(f'❌ `{setting}` needs a number from {low} to {high}!')
+        if setting in Config.LEVEL_THRESHOLDS:
+            levels = {**Config.LEVEL_THRESHOLDS, **{
+                level: minimum for level, minimum in settings['rule_overrides'].items()
+                if level in Config.LEVEL_THRESHOLDS
+            }, setting: int(value)}
+            if not levels['medium'] <= levels['high'] <= levels['critical']:
+                return await ctx.send(
+                    f'❌ Thresholds must stay medium ≤ high ≤ critical '
+                    f'(that would make them {levels["medium"]}, {levels["high"]}, {levels["critical"]})!'
+                )
+        if not await data_manager.settings.update(ctx.guild.id, 'rule_overrides', {setting: int(value)}, merge=True):
+            return await ctx.send('❌ Failed to save that setting!')
+        
+        await ctx.send(f'✅ `{setting}` set to **{value}**')
+        return await log_action(
+            ctx.guild,
+            'Settings Changed',
+            f'{ctx.author.mention} set `{setting}` to **{value}**',
+            Config.INFO
+        )
+    
+    if setting not in GuildSettings.EDITABLE or value is None:
+        return await ctx.send(f'❌ Usage: `{Config.PREFIX}altconfig <{"|".join(GuildSettings.EDITABLE)}|rule|level> <value>`')
     
-    # Run detection
-    await alt_detector.detect_alt(member, ctx.guild)
+    column, kind = GuildSettings.EDITABLE[setting]
+    if kind == 'bool':
+        if value.lower() in ('on', 'true', 'yes', 'enable', 'enabled'):
+            parsed = True
+        elif value.lower() in ('off', 'false', 'no', 'disable', 'disabled'):
+            parsed = False
+        else:
+            return await ctx.send('❌ Use `on` or `off`!')
+    else:
+        low, high = GuildSettings.LIMITS[setting]
+        if not value.isdigit() or not low <= int(value) <= high:
+            return await ctx.send(f'❌ `{setting}` needs a number from {low} to {high}!')
+        parsed = int(value)
+    
+    if not await data_manager.settings.update(ctx.guild.id, column, parsed):
+        return await ctx.send('❌ Failed to save that setting!')
+    
+    await ctx.send(f'✅ `{setting}` set to **{value}**')
     
-    await ctx.send('✅ Check complete! See security logs for details.')
+    await log_action(
+        ctx.guild,
+        'Settings Changed',
+        f'{ctx.author.mention} set `{setting}` to **{value}**',
+        Config.INFO
+    )
 
 @bot.command(name='althistory')
 @is_staff()
@@ -724,7 +3392,7 @@ async def alt_history(ctx, limit: int = 10):
     if limit > 50:
         limit = 50
     
-    detections = data_manager.get_alt_detections(ctx.guild.id, limit)
+    detections = await data_manager.get_alt_detections(ctx.guild.id, limit)
     
     if not detections:
         return await ctx.send('No alt detections found!')
@@ -752,40 +3420,80 @@ async def alt_history(ctx, limit: int = 10):
 
 @bot.command(name='altstats')
 @is_staff()
-async def alt_stats(ctx):
-    """View alt detection statistics"""
-    detections = data_manager.get_alt_detections(ctx.guild.id, 1000)
+async def alt_stats(ctx, days: int = None):
+    """View alt detection statistics (all time, or the last N days)"""
+    if days:
+        result = await data_manager.get_alt_stats(ctx.guild.id, days)
+        stats = result[0] if result else None
+    else:
+        stats = data_manager.get_detection_counts(ctx.guild.id)
     
-    if not detections:
+    if not stats or not stats['total']:
         return await ctx.send('No alt detections yet!')
     
-    total = len(detections)
-    critical = sum(1 for d in detections if d['suspicion_level'] == 'CRITICAL')
-    high = sum(1 for d in detections if d['suspicion_level'] == 'HIGH')
-    medium = sum(1 for d in detections if d['suspicion_level'] == 'MEDIUM')
-    low = sum(1 for d in detections if d['suspicion_level'] == 'LOW')
-    
-    timed_out = sum(1 for d in detections if d['timed_out'])
-    kicked = sum(1 for d in detections if d['kicked'])
-    
     embed = discord.Embed(
         title='📊 Alt Detection Statistics',
+        description=f'Last {days} days' if days else 'All time',
         color=Config.INFO
     )
     
-    embed.add_field(name='Total Detections', value=str(total), inline=True)
-    embed.add_field(name='Critical', value=str(critical), inline=True)
-    embed.add_field(name='High', value=str(high), inline=True)
-    embed.add_field(name='Medium', value=str(medium), inline=True)
-    embed.add_field(name='Low', value=str(low), inline=True)
+    embed.add_field(name='Total Detections', value=str(stats['total']), inline=True)
+    embed.add_field(name='Critical', value=str(stats['critical']), inline=True)
+    embed.add_field(name='High', value=str(stats['high']), inline=True)
+    embed.add_field(name='Medium', value=str(stats['medium']), inline=True)
+    embed.add_field(name='Low', value=str(stats['low']), inline=True)
     embed.add_field(name='‎', value='‎', inline=True)
     
-    embed.add_field(name='Timed Out', value=str(timed_out), inline=True)
-    embed.add_field(name='Kicked', value=str(kicked), inline=True)
+    embed.add_field(name='Timed Out', value=str(stats['timed_out']), inline=True)
+    embed.add_field(name='Kicked', value=str(stats['kicked']), inline=True)
     embed.add_field(name='‎', value='‎', inline=True)
     
     await ctx.send(embed=embed)
 
+@bot.command(name='botstats', aliases=['dbstats'])
+@is_staff()
+async def bot_stats(ctx):
+    """View database, queue and event loop health"""
+    db = data_manager.db.stats
+    writes = data_manager.write_stats
+    loop_stats = loop_monitor.snapshot()
+    avg_ms = db['total_ms'] / db['queries'] if db['queries'] else 0
+    
+    embed = discord.Embed(
+        title='🩺 Bot Statistics',
+        color=Config.INFO
+    )
+    
+    embed.add_field(name='Queries', value=str(db['queries']), inline=True)
+    embed.add_field(name='Failed', value=str(db['failed']), inline=True)
+    embed.add_field(name='Timed Out', value=str(db['timeouts']), inline=True)
+    embed.add_field(name='Avg Query', value=f'{avg_ms:.1f}ms', inline=True)
+    embed.add_field(name='Write Queue', value=str(data_manager.queue_depth), inline=True)
+    embed.add_field(name='Last Flush', value=f'{writes["last_flush_ms"]}ms', inline=True)
+    embed.add_field(name='Rows Flushed', value=str(writes['rows']), inline=True)
+    embed.add_field(name='Dropped', value=str(writes['dropped']), inline=True)
+    embed.add_field(
+        name='Database',
+        value='✅ Up' if data_manager.db.available else '❌ Down, reconnecting',
+        inline=True
+    )
+    embed.add_field(name='Journaled Writes', value=str(data_manager.journal.pending), inline=True)
+    embed.add_field(name='Log Queue', value=str(log_dispatcher.pending), inline=True)
+    embed.add_field(name='Logs Sent', value=str(log_dispatcher.stats['sent']), inline=True)
+    embed.add_field(name='Logs Dropped', value=str(log_dispatcher.stats['dropped']), inline=True)
+    embed.add_field(
+        name='Loop Lag',
+        value=f'{loop_stats["loop_lag_ms"]}ms (max {loop_stats["loop_lag_max_ms"]}ms)',
+        inline=True
+    )
+    embed.add_field(
+        name='Scoring Queue',
+        value=f'{scoring_pool.waiting} waiting ({Config.SCORING_EXECUTOR} pool)',
+        inline=True
+    )
+    
+    await ctx.send(embed=embed)
+
 # Help Command
 @bot.command(name='help')
 async def help_command(ctx):
@@ -816,9 +3524,12 @@ async def help_command(ctx):
         embed.add_field(
             name='🚨 Alt Detection (Staff Only)',
             value=(
-                f'`{Config.PREFIX}checkalt @user` - Manually check for alt\n'
+                f'`{Config.PREFIX}checkalt @user [apply]` - Score a member (dry run unless apply)\n'
+                f'`{Config.PREFIX}scanserver [cancel|restart]` - Scan all existing members\n'
                 f'`{Config.PREFIX}althistory [limit]` - View recent detections\n'
-                f'`{Config.PREFIX}altstats` - View detection statistics\n'
+                f'`{Config.PREFIX}altstats [days]` - View detection statistics\n'
+                f'`{Config.PREFIX}botstats` - View database & queue health\n'
+                f'`{Config.PREFIX}altconfig [setting] [value]` - View/change settings\n'
                 f'`{Config.PREFIX}whitelist @user [reason]` - Whitelist a user\n'
                 f'`{Config.PREFIX}unwhitelist @user` - Remove from whitelist'
             ),
@@ -840,12 +3551,13 @@ async def help_command(ctx):
     )
     
     # Settings Info
+    settings = data_manager.settings.get(ctx.guild.id)
     embed.add_field(
         name='⚙️ Current Settings',
         value=(
-            f'Min Account Age: **{Config.MIN_ACCOUNT_AGE} days**\n'
-            f'Auto Timeout: **{"Enabled" if Config.AUTO_TIMEOUT_ALTS else "Disabled"}**\n'
-            f'Timeout Duration: **{Config.TIMEOUT_DURATION} minutes**'
+            f'Min Account Age: **{settings["min_account_age"]} days**\n'
+            f'Auto Timeout: **{"Enabled" if settings["auto_timeout_alts"] else "Disabled"}**\n'
+            f'Timeout Duration: **{settings["timeout_duration"]} minutes**'
         ),
         inline=False
     )
@@ -881,9 +3593,10 @@ async def slash_help(interaction: discord.Interaction):
         embed.add_field(
             name='Alt Detection (Staff)',
             value=(
-                f'`{Config.PREFIX}checkalt @user`\n'
+                f'`{Config.PREFIX}checkalt @user` or `/checkalt`\n'
                 f'`{Config.PREFIX}althistory`\n'
                 f'`{Config.PREFIX}altstats`\n'
+                f'`{Config.PREFIX}altconfig`\n'
                 f'`{Config.PREFIX}whitelist @user`'
             ),
             inline=False
@@ -891,34 +3604,27 @@ async def slash_help(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@bot.tree.command(name="checkalt", description="Score a member for alt signals (read-only unless apply is set)")
+@app_commands.describe(member='Member to check', apply='Save the result and take the configured action')
+@app_commands.guild_only()
+async def slash_checkalt(interaction: discord.Interaction, member: discord.Member, apply: bool = False):
+    """Slash command version of checkalt"""
+    if interaction.user.id != Config.OWNER_ID and not interaction.user.guild_permissions.administrator:
+        return await interaction.response.send_message('❌ Staff only!', ephemeral=True)
+    
+    # Scoring can wait on a busy pool (raids, !scanserver), and timeouts and writes
+    # take longer still, so answer the 3 second interaction deadline first
+    await interaction.response.defer(ephemeral=not apply)
+    embed = await run_alt_check(interaction.guild, member, apply=apply)
+    await interaction.followup.send(embed=embed, ephemeral=not apply)
+
 # ============================================
 # SECTION 6: WEB SERVER (24/7 ON RENDER)
 # Paste this right after Section 5
 # ============================================
 
-async def start_web_server():
-    """
-    Starts a web server for Render + UptimeRobot
-    This keeps the bot alive 24/7!
-    """
-    
-    async def health_check(request):
-        """Health check endpoint for UptimeRobot"""
-        return web.Response(
-            text='✅ Bot is running!',
-            status=200,
-            content_type='text/plain'
-        )
-    
-    async def status_page(request):
-        """Beautiful status page"""
-        
-        # Calculate uptime
-        uptime_seconds = (datetime.utcnow() - bot.user.created_at).total_seconds()
-        uptime_hours = int(uptime_seconds // 3600)
-        uptime_days = uptime_hours // 24
-        
-        html = f'''
+# Rendered with str.format by StatusSnapshot (CSS braces are doubled)
+STATUS_PAGE_HTML = '''
 <!DOCTYPE html>
 <html>
 <head>
@@ -1059,19 +3765,19 @@ async def start_web_server():
         
         <div class="stats">
             <div class="stat">
-                <div class="stat-value">{len(bot.guilds)}</div>
+                <div class="stat-value">{guilds}</div>
                 <div class="stat-label">Servers</div>
             </div>
             <div class="stat">
-                <div class="stat-value">{len(bot.users)}</div>
+                <div class="stat-value">{users}</div>
                 <div class="stat-label">Users Protected</div>
             </div>
             <div class="stat">
-                <div class="stat-value">{round(bot.latency * 1000)}ms</div>
+                <div class="stat-value">{latency}</div>
                 <div class="stat-label">Latency</div>
             </div>
             <div class="stat">
-                <div class="stat-value">{uptime_days}d</div>
+                <div class="stat-value">{uptime}</div>
                 <div class="stat-label">Uptime</div>
             </div>
         </div>
@@ -1090,31 +3796,194 @@ async def start_web_server():
         
         <div class="footer">
             <p>Running on Render | Monitored by UptimeRobot</p>
-            <p>Bot ID: {bot.user.id}</p>
+            <p>Bot ID: {bot_id}</p>
         </div>
     </div>
 </body>
 </html>
-        '''
+'''
+
+STARTED_AT = time.time()
+
+class StatusSnapshot:
+    """
+    Status page and /stats, rendered on a timer.
+    
+    Requests only look up pre-encoded bodies (and answer If-None-Match with
+    304), so polling never touches the Discord caches.
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.pages = {}  # name: (body, etag, content type)
+        self._task = None
+    
+    def collect(self) -> dict:
+        ready = bot.is_ready()
+        return {
+            'status': 'online' if ready else 'starting',
+            'bot_name': bot.user.name if bot.user else None,
+            'bot_id': bot.user.id if bot.user else None,
+            'guilds': len(bot.guilds),
+            # member_count comes with each guild; no walk over the user cache
+            'users': sum(guild.member_count or 0 for guild in bot.guilds),
+            'latency_ms': round(bot.latency * 1000) if ready else None,
+            'uptime_seconds': int(time.time() - STARTED_AT),
+            'prefix': Config.PREFIX
+        }
+    
+    def _store(self, name: str, text: str, content_type: str):
+        body = text.encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self.pages[name] = (body, etag, content_type)
+    
+    def refresh(self):
+        stats = self.collect()
+        uptime_hours = stats['uptime_seconds'] // 3600
+        self._store('stats', json.dumps(stats), 'application/json')
+        self._store('status', STATUS_PAGE_HTML.format(
+            guilds=stats['guilds'],
+            users=stats['users'],
+            latency=f'{stats["latency_ms"]}ms' if stats['latency_ms'] is not None else '-',
+            uptime=f'{uptime_hours // 24}d {uptime_hours % 24}h',
+            bot_id=stats['bot_id'] or '-'
+        ), 'text/html')
+    
+    def start(self):
+        self.refresh()
+        if not self._task:
+            self._task = spawn(self._run())
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f'Failed to refresh status snapshot: {e}')
+                metrics.exceptions.inc('status_snapshot')
+    
+    def respond(self, request: web.Request, name: str) -> web.Response:
+        body, etag, content_type = self.pages[name]
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type=content_type, charset='utf-8', headers=headers)
+
+status_snapshot = StatusSnapshot(Config.STATUS_REFRESH_INTERVAL)
+
+def gateway_connected() -> bool:
+    """Whether the bot is ready and every gateway websocket is open"""
+    if not bot.is_ready() or bot.is_closed():
+        return False
+    if isinstance(bot, commands.AutoShardedBot):
+        return bool(bot.shards) and not any(shard.is_closed() for shard in bot.shards.values())
+    return bot.ws is not None and bot.ws.open
+
+class ReadinessCheck:
+    """Database, gateway and event loop checks for /ready, cached for a few seconds"""
+    
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.result = None
+        self.checked_at = 0.0
+        self._lock = None
+    
+    async def check(self) -> dict:
+        """The cached result, re-checked once it is older than the TTL"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Concurrent probes share one round of checks (and one DB ping)
+        async with self._lock:
+            if self.result is None or time.monotonic() - self.checked_at >= self.ttl:
+                self.result = await self._run_checks()
+                self.checked_at = time.monotonic()
+        return self.result
+    
+    async def _run_checks(self) -> dict:
+        # Without DATABASE_URL the bot runs unpersisted by design; nothing to wait for
+        configured = bool(Config.DATABASE_URL)
+        database = await data_manager.db.ping() if configured else True
+        connected = gateway_connected()
+        latency = bot.latency if connected else float('nan')
+        lag = loop_monitor.last_lag
         
+        checks = {
+            'database': {'ok': database, 'configured': configured},
+            'gateway': {
+                'ok': connected and math.isfinite(latency) and latency <= Config.READY_MAX_LATENCY,
+                'connected': connected,
+                'latency_ms': round(latency * 1000) if math.isfinite(latency) else None
+            },
+            'event_loop': {
+                'ok': lag < Config.READY_MAX_LOOP_LAG,
+                'lag_ms': round(lag * 1000, 1)
+            }
+        }
+        return {
+            'ready': all(check['ok'] for check in checks.values()),
+            'checks': checks,
+            'checked_at': time.time()
+        }
+
+readiness = ReadinessCheck(Config.READY_CHECK_TTL)
+
+# Queue depths and loop lag are read when /metrics is scraped
+metrics.gauge('securitybot_event_loop_lag_seconds', 'Event loop lag at the last check',
+              lambda: loop_monitor.last_lag)
+metrics.gauge('securitybot_event_loop_lag_max_seconds', 'Worst event loop lag since start',
+              lambda: loop_monitor.max_lag)
+metrics.gauge('securitybot_event_loop_stalls', 'Event loop stalls since start',
+              lambda: loop_monitor.stalls)
+metrics.gauge('securitybot_write_queue_rows', 'Rows waiting for the next write-behind flush',
+              lambda: data_manager.queue_depth)
+metrics.gauge('securitybot_database_up', 'Whether the database is connected and answering',
+              lambda: int(data_manager.db.available))
+metrics.gauge('securitybot_journal_entries', 'Writes journaled while the database was down, not yet replayed',
+              lambda: data_manager.journal.pending)
+metrics.gauge('securitybot_log_queue_embeds', 'Security log embeds waiting to be sent',
+              lambda: log_dispatcher.pending)
+metrics.gauge('securitybot_scoring_waiting', 'Scoring calls waiting for a free slot',
+              lambda: scoring_pool.waiting)
+
+async def start_web_server():
+    """
+    Starts a web server for Render + UptimeRobot
+    This keeps the bot alive 24/7!
+    """
+    
+    async def health_check(request):
+        """Liveness: the process and its event loop are answering (UptimeRobot)"""
         return web.Response(
-            text=html,
-            content_type='text/html'
+            text='✅ Bot is running!',
+            status=200,
+            content_type='text/plain'
         )
     
+    async def ready_check(request):
+        """Readiness: database, gateway and event loop are all healthy"""
+        result = await readiness.check()
+        return web.json_response(result, status=200 if result['ready'] else 503)
+    
+    async def status_page(request):
+        """Beautiful status page"""
+        return status_snapshot.respond(request, 'status')
+    
     async def bot_stats_json(request):
         """JSON endpoint for API access"""
-        stats = {{
-            'status': 'online',
-            'bot_name': bot.user.name,
-            'bot_id': bot.user.id,
-            'guilds': len(bot.guilds),
-            'users': len(bot.users),
-            'latency_ms': round(bot.latency * 1000),
-            'prefix': Config.PREFIX
-        }}
-        
-        return web.json_response(stats)
+        return status_snapshot.respond(request, 'stats')
+    
+    async def metrics_endpoint(request):
+        """Prometheus text format metrics"""
+        return web.Response(
+            text=metrics.render(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
+    
+    # Render once now, then on a timer
+    status_snapshot.start()
     
     # Create web app
     app = web.Application()
@@ -1123,7 +3992,10 @@ async def start_web_server():
     app.router.add_get('/', status_page)
     app.router.add_get('/health', health_check)
     app.router.add_get('/ping', health_check)
+    app.router.add_get('/live', health_check)
+    app.router.add_get('/ready', ready_check)
     app.router.add_get('/stats', bot_stats_json)
+    app.router.add_get('/metrics', metrics_endpoint)
     
     # Start server
     runner = web.AppRunner(app)
@@ -1132,22 +4004,240 @@ async def start_web_server():
     await site.start()
     
     logger.info(f'✅ Web server running on port {Config.PORT}')
-    logger.info(f'📍 Health check: http://0.0.0.0:{Config.PORT}/health')
+    logger.info(f'📍 Health check: http://0.0.0.0:{Config.PORT}/health (readiness: /ready)')
     logger.info(f'📊 Status page: http://0.0.0.0:{Config.PORT}/')
+    logger.info(f'📈 Metrics: http://0.0.0.0:{Config.PORT}/metrics')
+
+# ============================================
+# SECTION 7: SHARDED LAUNCHER (MULTI-PROCESS)
+# Paste this right after Section 6
+# ============================================
+
+def split_shards(shard_ids: List[int], processes: int) -> List[List[int]]:
+    """Spread shard ids over processes as evenly as possible"""
+    processes = max(1, min(processes, len(shard_ids)))
+    return [shard_ids[i::processes] for i in range(processes)]
+
+def cluster_snapshot(ready: dict) -> dict:
+    """What one shard process reports to the launcher"""
+    return {
+        'cluster_id': Config.CLUSTER_ID,
+        'pid': os.getpid(),
+        'shard_ids': sorted(Config.SHARD_IDS),
+        'ready': ready['ready'],
+        'checks': ready['checks'],
+        'guilds': len(bot.guilds),
+        'users': sum(g.member_count or 0 for g in bot.guilds),
+        'latency_ms': round(bot.latency * 1000) if bot.is_ready() else None,
+        'reported_at': time.time(),
+        **loop_monitor.snapshot()
+    }
+
+async def report_cluster_stats(stats_queue):
+    """Push this process's snapshot to the launcher every few seconds"""
+    while True:
+        try:
+            snapshot = cluster_snapshot(await readiness.check())
+            snapshot['metrics'] = metrics.render()  # served merged by the launcher
+            stats_queue.put_nowait(snapshot)
+        except Exception as e:
+            logger.warning(f'Failed to report cluster stats: {e}')
+            metrics.exceptions.inc('cluster_stats')
+        await asyncio.sleep(Config.CLUSTER_STATS_INTERVAL)
+
+def run_cluster(stats_queue):
+    """Entry point of one shard process (env already carries its shard ids)"""
+    try:
+        asyncio.run(main(stats_queue))
+    except KeyboardInterrupt:
+        pass
+
+def merge_cluster_metrics(texts: Dict[int, str]) -> str:
+    """Merge shard processes' /metrics texts, adding a cluster label to every sample"""
+    headers = {}  # metric name: HELP and TYPE lines
+    samples = defaultdict(list)
+    for cluster_id, text in sorted(texts.items()):
+        name = None
+        for line in text.splitlines():
+            if line.startswith('# '):
+                name = line.split()[2]
+                header = headers.setdefault(name, [])
+                if line not in header:
+                    header.append(line)
+            elif line:
+                series, _, value = line.rpartition(' ')
+                if '{' in series:
+                    series = series.replace('{', f'{{cluster="{cluster_id}",', 1)
+                else:
+                    series = f'{series}{{cluster="{cluster_id}"}}'
+                samples[name].append(f'{series} {value}')
+    
+    lines = []
+    for name, header in headers.items():
+        lines.extend(header)
+        lines.extend(samples[name])
+    return '\n'.join(lines) + '\n'
+
+class Launcher:
+    """Runs the bot as several shard processes and serves one aggregated /stats, /ready and /metrics"""
+    
+    def __init__(self, shard_count: int, shard_ids: List[int], processes: int):
+        self.shard_count = shard_count
+        self.groups = split_shards(shard_ids, processes)
+        self.context = multiprocessing.get_context('spawn')
+        self.stats_queue = self.context.Queue()
+        self.processes = {}  # cluster_id: Process
+        self.cluster_stats = {}  # cluster_id: latest snapshot
+        self.cluster_metrics = {}  # cluster_id: latest rendered /metrics
+    
+    def start_cluster(self, cluster_id: int):
+        # Spawned children re-import this file, so Config picks these up
+        os.environ['SHARD_COUNT'] = str(self.shard_count)
+        os.environ['SHARD_IDS'] = ','.join(map(str, self.groups[cluster_id]))
+        os.environ['CLUSTER_ID'] = str(cluster_id)
+        
+        process = self.context.Process(
+            target=run_cluster,
+            args=(self.stats_queue,),
+            name=f'cluster-{cluster_id}',
+            daemon=True
+        )
+        process.start()
+        self.processes[cluster_id] = process
+        logger.info(f'🚀 Cluster {cluster_id} started (pid {process.pid}, shards {self.groups[cluster_id]})')
+    
+    async def collect_stats(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                snapshot = await loop.run_in_executor(None, self.stats_queue.get, True, 1)
+            except queue.Empty:
+                continue
+            self.cluster_metrics[snapshot['cluster_id']] = snapshot.pop('metrics', '')
+            self.cluster_stats[snapshot['cluster_id']] = snapshot
+    
+    async def supervise(self):
+        """Restart shard processes that die"""
+        while True:
+            await asyncio.sleep(Config.CLUSTER_STATS_INTERVAL)
+            for cluster_id, process in list(self.processes.items()):
+                if not process.is_alive():
+                    logger.error(f'❌ Cluster {cluster_id} exited ({process.exitcode}), restarting')
+                    self.cluster_stats.pop(cluster_id, None)
+                    self.cluster_metrics.pop(cluster_id, None)
+                    self.start_cluster(cluster_id)
+    
+    def aggregate(self) -> dict:
+        clusters = [self.cluster_stats.get(i) for i in range(len(self.groups))]
+        stale_after = time.time() - Config.CLUSTER_STATS_INTERVAL * 3
+        healthy = [c for c in clusters if c and c['ready'] and c['reported_at'] >= stale_after]
+        latencies = [c['latency_ms'] for c in healthy if c['latency_ms'] is not None]
+        
+        return {
+            'status': 'online' if len(healthy) == len(clusters) else 'degraded',
+            'shard_count': self.shard_count,
+            'clusters_total': len(clusters),
+            'clusters_healthy': len(healthy),
+            'guilds': sum(c['guilds'] for c in clusters if c),
+            'users': sum(c['users'] for c in clusters if c),
+            'latency_ms': max(latencies) if latencies else None,
+            'loop_lag_max_ms': max((c['loop_lag_max_ms'] for c in clusters if c), default=0),
+            'prefix': Config.PREFIX,
+            'clusters': [c or {'cluster_id': i, 'ready': False} for i, c in enumerate(clusters)]
+        }
+    
+    async def start_web_server(self):
+        async def live_check(request):
+            # Liveness only, like the single-process /health: a cluster that isn't
+            # ready yet must not get the whole launcher restarted
+            return web.Response(text='✅ Launcher is running!', content_type='text/plain')
+        
+        async def ready_check(request):
+            stats = self.aggregate()
+            healthy = stats['clusters_healthy'] == stats['clusters_total']
+            return web.Response(
+                text=f'{"✅" if healthy else "⚠️"} {stats["clusters_healthy"]}/{stats["clusters_total"]} clusters ready',
+                status=200 if healthy else 503,
+                content_type='text/plain'
+            )
+        
+        async def stats_json(request):
+            return web.json_response(self.aggregate())
+        
+        async def metrics_endpoint(request):
+            """Every cluster's metrics as of its last report, labelled by cluster"""
+            return web.Response(
+                text=merge_cluster_metrics(self.cluster_metrics),
+                headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+            )
+        
+        app = web.Application()
+        app.router.add_get('/', stats_json)
+        app.router.add_get('/health', live_check)
+        app.router.add_get('/ping', live_check)
+        app.router.add_get('/live', live_check)
+        app.router.add_get('/ready', ready_check)
+        app.router.add_get('/stats', stats_json)
+        app.router.add_get('/metrics', metrics_endpoint)
+        
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '0.0.0.0', Config.PORT)
+        await site.start()
+        logger.info(f'✅ Launcher web server running on port {Config.PORT}')
+    
+    async def create_tables(self):
+        """Create tables once before the clusters start, so they only find them in place"""
+        if not Config.DATABASE_URL:
+            return
+        db = Database()
+        try:
+            db.pool = await asyncio.get_running_loop().run_in_executor(db.executor, db._create_pool)
+            await db.create_tables()
+        except Exception as e:
+            logger.warning(f'⚠️ Launcher could not create tables, clusters will: {e}')
+        finally:
+            await db.close()
+    
+    async def run(self):
+        await self.start_web_server()
+        await self.create_tables()
+        for cluster_id in range(len(self.groups)):
+            self.start_cluster(cluster_id)
+        
+        try:
+            await asyncio.gather(self.collect_stats(), self.supervise())
+        finally:
+            for process in self.processes.values():
+                process.terminate()
+            for process in self.processes.values():
+                process.join(timeout=10)
 
 # ============================================
 # MAIN FUNCTION - START EVERYTHING
 # ============================================
 
-async def main():
+async def main(stats_queue=None):
     """
     Main function that starts everything
-    1. Starts web server (for 24/7 uptime)
-    2. Starts the Discord bot
+    1. Connects to the database (pooled, off the event loop)
+    2. Starts web server (for 24/7 uptime) - or, as a shard process,
+       reports stats to the launcher, which serves the web endpoints
+    3. Starts the Discord bot
     """
     
+    await data_manager.setup()
+    # Before the gateway connects, so live joins always land after the rebuilt ones;
+    # if the database is down now, the rebuild runs once it is back
+    await alt_detector.rebuild_recent_joins()
+    data_manager.db.on_reconnect.append(alt_detector.rebuild_recent_joins)
+    loop_monitor.start()
+    
     # Start web server first
-    await start_web_server()
+    if stats_queue is None:
+        await start_web_server()
+    else:
+        spawn(report_cluster_stats(stats_queue))
     
     # Start bot
     try:
@@ -1158,6 +4248,9 @@ async def main():
     except Exception as e:
         logger.error(f'Bot error: {e}')
         await bot.close()
+    finally:
+        scoring_pool.close()
+        await data_manager.close()
 
 # ============================================
 # RUN THE BOT
@@ -1190,7 +4283,13 @@ if __name__ == '__main__':
     
     # Run the bot
     try:
-        asyncio.run(main())
+        if Config.PROCESS_COUNT > 1:
+            shard_count = Config.SHARD_COUNT or Config.PROCESS_COUNT
+            shard_ids = sorted(Config.SHARD_IDS) or list(range(shard_count))
+            print(f'🧩 Launching {Config.PROCESS_COUNT} processes for shards {shard_ids} of {shard_count}\n')
+            asyncio.run(Launcher(shard_count, shard_ids, Config.PROCESS_COUNT).run())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info('Bot stopped by user')
         print('\n👋 Bot stopped!\n')
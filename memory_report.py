@@ -0,0 +1,144 @@
+"""
+Memory report: full intents + member cache vs LEAN_INTENTS
+
+Feeds a synthetic guild's members through discord.py's own GUILD_MEMBER_ADD
+handler (the same path chunking and joins take) and puts every join through
+the alt detector's join window, then reports what stayed allocated. Also
+compares bytes per tracked join for JoinRecords vs holding Member objects.
+
+Usage: python memory_report.py [members]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from discord import Member
+from discord.guild import Guild
+from discord.state import ConnectionState
+
+import bot as security_bot
+
+GUILD_ID = 1
+
+def guild_payload(member_count: int) -> dict:
+    return {
+        'id': str(GUILD_ID),
+        'name': 'Synthetic Guild',
+        'owner_id': '1',
+        'member_count': member_count,
+        'roles': [],
+        'emojis': [],
+        'stickers': [],
+        'features': [],
+        'channels': [],
+        'members': []
+    }
+
+def member_payload(i: int) -> dict:
+    return {
+        'guild_id': str(GUILD_ID),
+        'user': {
+            'id': str(10**17 + i),
+            'username': f'member{i}',
+            'discriminator': '0',
+            'global_name': f'Member {i}',
+            'avatar': f'{i:032x}' if i % 3 else None
+        },
+        'roles': [],
+        'nick': None,
+        'joined_at': '2024-01-01T00:00:00+00:00',
+        'deaf': False,
+        'mute': False,
+        'flags': 0
+    }
+
+def measure(lean: bool, members: int) -> dict:
+    """Bytes held by the gateway state and join window after `members` joins"""
+    options = security_bot.gateway_options(lean)
+    gc.collect()
+    tracemalloc.start()
+
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None, **options)
+    guild = Guild(data=guild_payload(members), state=state)
+    state._add_guild(guild)
+    tracker = security_bot.JoinTracker(security_bot.Config.RECENT_JOIN_WINDOW, security_bot.Config.RECENT_JOIN_MAX)
+
+    started = time.perf_counter()
+    now = time.time()
+    for i in range(members):
+        data = member_payload(i)
+        state.parse_guild_member_add(data)
+        member = guild.get_member(10**17 + i) or Member(data=data, guild=guild, state=state)
+        tracker.add(GUILD_ID, security_bot.JoinRecord.from_member(member, now))
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'mode': 'lean' if lean else 'full',
+        'cached_members': len(guild._members),
+        'tracked_joins': len(tracker),
+        'bytes': current,
+        'bytes_per_member': round(current / members, 1),
+        'peak_bytes': peak,
+        'seconds': round(elapsed, 2)
+    }
+
+def measure_join_window(joins: int) -> dict:
+    """Bytes per tracked join: discord.Member vs JoinRecord, alone and in a JoinTracker (with its similarity index)"""
+    options = security_bot.gateway_options(True)
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None, **options)
+    guild = Guild(data=guild_payload(joins), state=state)
+    now = time.time()
+
+    results = {}
+    for kind in ('member', 'record', 'tracker'):
+        gc.collect()
+        tracemalloc.start()
+        if kind == 'tracker':
+            window = security_bot.JoinTracker(security_bot.Config.RECENT_JOIN_WINDOW, joins)
+        else:
+            window = OrderedDict()
+        for i in range(joins):
+            member = Member(data=member_payload(i), guild=guild, state=state)
+            if kind == 'member':
+                window[member.id] = (member, now)
+            elif kind == 'record':
+                window[member.id] = security_bot.JoinRecord.from_member(member, now)
+            else:
+                window.add(GUILD_ID, security_bot.JoinRecord.from_member(member, now))
+            del member
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[kind] = round(current / joins, 1)
+        del window
+
+    return results
+
+if __name__ == '__main__':
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    results = [measure(False, members), measure(True, members)]
+
+    print(f'\nSynthetic guild: {members:,} members\n')
+    print(f'{"mode":<6} {"cached":>9} {"tracked":>9} {"MiB":>9} {"B/member":>9} {"peak MiB":>9}')
+    for r in results:
+        print(
+            f'{r["mode"]:<6} {r["cached_members"]:>9,} {r["tracked_joins"]:>9,} '
+            f'{r["bytes"] / 2**20:>9.1f} {r["bytes_per_member"]:>9} {r["peak_bytes"] / 2**20:>9.1f}'
+        )
+
+    full, lean = results
+    print(f'\nLean mode holds {100 * (1 - lean["bytes"] / full["bytes"]):.0f}% less memory')
+
+    window = measure_join_window(security_bot.Config.RECENT_JOIN_MAX)
+    print(f'\nJoin window, {security_bot.Config.RECENT_JOIN_MAX:,} joins (bytes per join):')
+    print(f'   discord.Member: {window["member"]:>8}')
+    print(f'   JoinRecord:     {window["record"]:>8}')
+    print(f'   JoinTracker:    {window["tracker"]:>8}  (JoinRecord + similarity index entries)\n')
@@ -0,0 +1,73 @@
+"""
+SimilarityIndex must flag exactly what the brute-force ratio scan flags.
+
+Run with: python -m pytest test_similarity_index.py
+"""
+
+import random
+import string
+from difflib import SequenceMatcher
+
+import pytest
+
+from bot import SimilarityIndex, normalize_username
+
+def random_names(rng: random.Random, count: int) -> list:
+    """Random names plus near-copies of them, so some pairs are similar"""
+    names = []
+    for _ in range(count):
+        if names and rng.random() < 0.4:
+            name = list(rng.choice(names))
+            for _ in range(rng.randint(1, 3)):
+                position = rng.randrange(len(name) + 1)
+                edit = rng.choice(('insert', 'delete', 'replace'))
+                if edit == 'insert' or not name:
+                    name.insert(position, rng.choice(string.ascii_lowercase + string.digits))
+                elif edit == 'delete':
+                    name.pop(min(position, len(name) - 1))
+                else:
+                    name[min(position, len(name) - 1)] = rng.choice(string.ascii_lowercase)
+            names.append(''.join(name))
+        else:
+            names.append(''.join(
+                rng.choice(string.ascii_lowercase + string.digits) for _ in range(rng.randint(3, 16))
+            ))
+    return [normalize_username(name) for name in names]
+
+def brute_force(names: dict, clean: str, threshold: float, exclude: int) -> set:
+    """Users at least `threshold` similar, argument order as in RulePlan.find_similar"""
+    return {
+        user_id for user_id, other in names.items()
+        if user_id != exclude and other and clean
+        and SequenceMatcher(None, clean, other).ratio() >= threshold
+    }
+
+@pytest.mark.parametrize('threshold', [0.6, 0.7, 0.8, 0.9])
+def test_candidates_cover_brute_force(threshold):
+    rng = random.Random(threshold)
+    names = dict(enumerate(random_names(rng, 400)))
+    index = SimilarityIndex(threshold)
+    for user_id, clean in names.items():
+        index.add(user_id, clean)
+
+    # Drop some users again, so removal is covered too
+    for user_id in rng.sample(sorted(names), 100):
+        index.remove(user_id, names.pop(user_id))
+    assert len(index) == sum(1 for clean in names.values() if clean)
+
+    for user_id, clean in names.items():
+        similar = brute_force(names, clean, threshold, user_id)
+        flagged = {
+            other for other in index.candidates(clean, user_id)
+            if SequenceMatcher(None, clean, names[other]).ratio() >= threshold
+        }
+        assert flagged == similar
+
+def test_remove_leaves_no_postings():
+    index = SimilarityIndex(0.8)
+    index.add(1, 'alice')
+    index.add(2, 'alicia')
+    index.remove(1, 'alice')
+    index.remove(2, 'alicia')
+    assert len(index) == 0
+    assert not index.postings